@@ -1,6 +1,11 @@
+import os
+import threading
+
 from flask import Flask, jsonify, request
 from http import HTTPStatus
 
+from persistence import RecipeLog
+
 
 app = Flask(__name__)
 
@@ -17,6 +22,46 @@ recipes = [
     }
 ]
 
+lock = threading.Lock()
+last_id = len(recipes)
+log = None
+
+# Keep recipes across restarts, e.g. RECIPE_DATA_DIR=./data
+if os.environ.get('RECIPE_DATA_DIR'):
+    log = RecipeLog(os.environ['RECIPE_DATA_DIR'])
+    records, logged_last_id = log.load()
+
+    if logged_last_id:
+        recipes = sorted(records.values(), key=lambda recipe: recipe['id'])
+        last_id = logged_last_id
+    else:
+        for recipe in recipes:
+            log.append('put', recipe['id'], recipe)
+
+
+def save(op, recipe):
+    # Call with lock held; returns the sequence number to wait for once it is released
+    if log is None:
+        return None
+
+    seq = log.write(op, recipe['id'], recipe)
+
+    if log.needs_snapshot():
+        log.snapshot([dict(recipe) for recipe in recipes], last_id)
+
+    return seq
+
+
+def check():
+    # A failed log refuses the write; refuse it before recipes changes too
+    if log is not None:
+        log.check()
+
+
+def wait(seq):
+    if seq is not None:
+        log.wait(seq)
+
 @app.route('/recipes',methods=['GET'])
 
 def get_recipes():
@@ -37,17 +82,29 @@ def get_recipe(recipe_id):
 @app.route('/recipes',methods=['POST'])
 
 def create_recipe():
+    global last_id
+
     data = request.get_json()
     name = data.get('name')
     description = data.get('description')
 
-    recipe = {
-        'id':len(recipes)+1,
-        'name':name,
-        'description':description
-    }
+    with lock:
+        check()
+
+        # Ids are never reused, even after the newest recipe is deleted
+        last_id += 1
+
+        recipe = {
+            'id':last_id,
+            'name':name,
+            'description':description
+        }
 
-    recipes.append(recipe)
+        recipes.append(recipe)
+
+        seq = save('put', recipe)
+
+    wait(seq)
 
     return jsonify(recipe), HTTPStatus.CREATED
 
@@ -63,13 +120,24 @@ def update_recipe(recipe_id):
 
     data = request.get_json()
 
-    recipe.update(
+    with lock:
+        check()
 
-        {
-            'name':data.get('name'),
-            'description':data.get('description')
-        }
-    )
+        # Deleted since the lookup; logging a put now would bring it back on replay
+        if recipe not in recipes:
+            return jsonify({'message':'recipe not found.'}), HTTPStatus.NOT_FOUND
+
+        recipe.update(
+
+            {
+                'name':data.get('name'),
+                'description':data.get('description')
+            }
+        )
+
+        seq = save('put', recipe)
+
+    wait(seq)
 
     return jsonify(recipe)
 
@@ -82,7 +150,17 @@ def delete_recipe(recipe_id):
     if not recipe:
         return jsonify({'message':'recipe not found.'}), HTTPStatus.NOT_FOUND
 
-    recipes.pop(recipes.index(recipe))
+    with lock:
+        check()
+
+        if recipe not in recipes:
+            return jsonify({'message':'recipe not found.'}), HTTPStatus.NOT_FOUND
+
+        recipes.pop(recipes.index(recipe))
+
+        seq = save('delete', recipe)
+
+    wait(seq)
 
     return jsonify({'message':'recipe deleted', 'recipe':recipe})
 
@@ -0,0 +1,273 @@
+import json
+import mmap
+import os
+import threading
+
+SNAPSHOT_FILE = 'snapshot.jsonl'
+SEGMENT_PREFIX = 'log-'
+SEGMENT_SUFFIX = '.jsonl'
+
+
+class RecipeLogError(Exception):
+    pass
+
+
+def fsync_directory(directory):
+    # Makes a rename durable; not available on Windows
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_lines(path):
+
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for line in iter(data.readline, b''):
+            yield line
+
+
+# Durable storage for an in-memory recipe store: every change is appended to a log
+# segment as one JSON line, and a snapshot of all recipes is written every
+# snapshot_every changes so that a restart only replays the segments after it.
+#
+# Appends are group committed: write() queues a line and returns its sequence
+# number, a single writer thread writes and fsyncs whatever has queued up since
+# its last fsync, and wait() blocks until a sequence number is on disk.
+#
+# If the writer fails (ENOSPC, EIO) the log stops: waiting and later writes raise
+# RecipeLogError, and changes since the last fsync are lost on restart.
+class RecipeLog:
+
+    def __init__(self, directory, snapshot_every=100000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+
+        self.condition = threading.Condition()
+        self.pending = []
+        self.seq = 0
+        self.flushed_seq = 0
+        self.since_snapshot = 0
+        self.snapshotting = False
+        self.closed = False
+        self.error = None
+
+        self.file = None
+        self.file_first_seq = None
+        self.writer = None
+
+    def segment_path(self, first_seq):
+        return os.path.join(self.directory, '{}{:020d}{}'.format(SEGMENT_PREFIX, first_seq, SEGMENT_SUFFIX))
+
+    def get_segments(self):
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+        return [(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name))
+                for name in names]
+
+    def load(self):
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        records = {}
+        last_id = 0
+        snapshot_seq = 0
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+
+        if os.path.exists(snapshot_path):
+            lines = read_lines(snapshot_path)
+            header = json.loads(next(lines))
+            snapshot_seq, last_id = header['seq'], header['last_id']
+
+            for line in lines:
+                record = json.loads(line)
+                records[record['id']] = record
+
+        self.seq = snapshot_seq
+
+        for first_seq, path in self.get_segments():
+            if os.path.getsize(path) == 0:
+                # Left by a restart with no changes
+                os.remove(path)
+                continue
+
+            for line in read_lines(path):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn write from a crash; nothing after it in this segment was acknowledged
+                    break
+
+                if entry['seq'] <= snapshot_seq:
+                    continue
+
+                if entry['op'] == 'put':
+                    records[entry['recipe']['id']] = entry['recipe']
+                    last_id = max(last_id, entry['recipe']['id'])
+                else:
+                    records.pop(entry['id'], None)
+
+                self.seq = entry['seq']
+                self.since_snapshot += 1
+
+        self.flushed_seq = self.seq
+
+        # Always continue in a new segment so a torn tail is never followed by good entries
+        self.file = open(self.segment_path(self.seq + 1), 'a')
+        self.file_first_seq = self.seq + 1
+        fsync_directory(self.directory)
+
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+        return records, last_id
+
+    def write(self, op, recipe_id, recipe=None):
+
+        with self.condition:
+            self.check()
+
+            self.seq += 1
+            self.since_snapshot += 1
+
+            entry = {'seq': self.seq, 'op': op}
+            if op == 'put':
+                entry['recipe'] = recipe
+            else:
+                entry['id'] = recipe_id
+
+            self.pending.append(json.dumps(entry) + '\n')
+            self.condition.notify_all()
+
+            return self.seq
+
+    def wait(self, seq):
+        with self.condition:
+            while self.flushed_seq < seq and not self.closed and self.error is None:
+                self.condition.wait()
+
+            if self.flushed_seq < seq:
+                self.check()
+
+    def check(self):
+        # Raises once the writer has failed; call before changing what the next write records
+        with self.condition:
+            if self.error is not None:
+                raise RecipeLogError('Recipe log writer failed: {}'.format(self.error)) from self.error
+
+    def append(self, op, recipe_id, recipe=None):
+        self.wait(self.write(op, recipe_id, recipe))
+
+    def run(self):
+
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+
+                if not self.pending and self.closed:
+                    return
+
+                batch, self.pending = self.pending, []
+                seq = self.seq
+
+            try:
+                for item in batch:
+                    if isinstance(item, int):
+                        self.start_segment(item)
+                    else:
+                        self.file.write(item)
+
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except Exception as e:
+                # Whether any of the batch reached the disk is unknown; fail its waiters and stop
+                with self.condition:
+                    self.error = e
+                    self.condition.notify_all()
+                return
+
+            with self.condition:
+                self.flushed_seq = seq
+                self.condition.notify_all()
+
+    def start_segment(self, first_seq):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        self.file = open(self.segment_path(first_seq), 'a')
+        fsync_directory(self.directory)
+
+        with self.condition:
+            self.file_first_seq = first_seq
+            self.condition.notify_all()
+
+    def needs_snapshot(self):
+        return self.since_snapshot >= self.snapshot_every and not self.snapshotting
+
+    def snapshot(self, records, last_id):
+
+        # Called while the store is not changing: records and last_id must match self.seq.
+        # Writing happens in the background; records must not be mutated afterwards.
+        with self.condition:
+            if self.snapshotting:
+                return
+
+            self.snapshotting = True
+            self.since_snapshot = 0
+
+            seq = self.seq
+            self.pending.append(seq + 1)
+            self.condition.notify_all()
+
+        threading.Thread(target=self.write_snapshot, args=(records, last_id, seq), daemon=True).start()
+
+    def write_snapshot(self, records, last_id, seq):
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temporary_path = snapshot_path + '.tmp'
+
+        try:
+            with open(temporary_path, 'w') as f:
+                f.write(json.dumps({'seq': seq, 'last_id': last_id}) + '\n')
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temporary_path, snapshot_path)
+            fsync_directory(self.directory)
+
+            # The segment being appended to must never be removed
+            with self.condition:
+                while self.file_first_seq <= seq and not self.closed and self.error is None:
+                    self.condition.wait()
+
+                if self.file_first_seq <= seq:
+                    return
+
+            for first_seq, path in self.get_segments():
+                if first_seq <= seq:
+                    os.remove(path)
+        finally:
+            with self.condition:
+                self.snapshotting = False
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        if self.writer is not None:
+            self.writer.join()
+
+            if not self.file.closed:
+                self.file.close()
@@ -1,11 +1,18 @@
+import os
+
 from flask import Flask
 from flask_restful import Api
 
+from models.recipe import recipe_store
 from resources.recipe import RecipeListResource, RecipeResource, RecipePublishResource
 
 app = Flask(__name__)
 api = Api(app)
 
+# Keep recipes across restarts, e.g. RECIPE_DATA_DIR=./data
+if os.environ.get('RECIPE_DATA_DIR'):
+    recipe_store.open(os.environ['RECIPE_DATA_DIR'])
+
 api.add_resource(RecipeListResource, '/recipes')
 api.add_resource(RecipeResource, '/recipes/<int:recipe_id>')
 api.add_resource(RecipePublishResource, '/recipes/<int:recipe_id>/publish')
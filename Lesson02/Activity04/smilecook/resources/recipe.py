@@ -2,18 +2,14 @@ from flask import request
 from flask_restful import Resource
 from http import HTTPStatus
 
-from models.recipe import Recipe, recipe_list
+from models.recipe import Recipe, recipe_store
 
 
 class RecipeListResource(Resource):
 
     def get(self):
 
-        data = []
-
-        for recipe in recipe_list:
-            if recipe.is_publish is True:
-                data.append(recipe.data)
+        data = [recipe.data for recipe in recipe_store.get_published()]
 
         return {'data': data}, HTTPStatus.OK
 
@@ -26,7 +22,7 @@ class RecipeListResource(Resource):
                         cook_time=data['cook_time'],
                         directions=data['directions'])
 
-        recipe_list.append(recipe)
+        recipe_store.add(recipe)
 
         return recipe.data, HTTPStatus.CREATED
 
@@ -34,9 +30,9 @@ class RecipeListResource(Resource):
 class RecipeResource(Resource):
 
     def get(self, recipe_id):
-        recipe = next((recipe for recipe in recipe_list if recipe.id == recipe_id and recipe.is_publish == True), None)
+        recipe = recipe_store.get(recipe_id)
 
-        if recipe is None:
+        if recipe is None or recipe.is_publish is not True:
             return {'message': 'recipe not found'}, HTTPStatus.NOT_FOUND
 
         return recipe.data, HTTPStatus.OK
@@ -44,48 +40,41 @@ class RecipeResource(Resource):
     def put(self, recipe_id):
         data = request.get_json()
 
-        recipe = next((recipe for recipe in recipe_list if recipe.id == recipe_id), None)
+        recipe = recipe_store.update(recipe_id,
+                                     name=data['name'],
+                                     description=data['description'],
+                                     num_of_servings=data['num_of_servings'],
+                                     cook_time=data['cook_time'],
+                                     directions=data['directions'])
 
         if recipe is None:
             return {'message': 'recipe not found'}, HTTPStatus.NOT_FOUND
 
-        recipe.name = data['name']
-        recipe.description = data['description']
-        recipe.num_of_servings = data['num_of_servings']
-        recipe.cook_time = data['cook_time']
-        recipe.directions = data['directions']
-
         return recipe.data, HTTPStatus.OK
 
     def delete(self, recipe_id):
-        recipe = next((recipe for recipe in recipe_list if recipe.id == recipe_id), None)
+        recipe = recipe_store.remove(recipe_id)
 
         if recipe is None:
             return {'message': 'recipe not found'}, HTTPStatus.NOT_FOUND
 
-        recipe_list.remove(recipe)
-
         return {}, HTTPStatus.NO_CONTENT
 
 
 class RecipePublishResource(Resource):
 
     def put(self, recipe_id):
-        recipe = next((recipe for recipe in recipe_list if recipe.id == recipe_id), None)
+        recipe = recipe_store.update(recipe_id, is_publish=True)
 
         if recipe is None:
             return {'message': 'recipe not found'}, HTTPStatus.NOT_FOUND
 
-        recipe.is_publish = True
-
         return {}, HTTPStatus.NO_CONTENT
 
     def delete(self, recipe_id):
-        recipe = next((recipe for recipe in recipe_list if recipe.id == recipe_id), None)
+        recipe = recipe_store.update(recipe_id, is_publish=False)
 
         if recipe is None:
             return {'message': 'recipe not found'}, HTTPStatus.NOT_FOUND
 
-        recipe.is_publish = False
-
         return {}, HTTPStatus.NO_CONTENT
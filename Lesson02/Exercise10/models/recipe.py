@@ -1,18 +1,151 @@
-recipe_list = []
+import copy
+import threading
+from bisect import insort
 
+from persistence import RecipeLog
 
-def get_last_id():
-    if recipe_list:
-        last_recipe = recipe_list[-1]
-    else:
-        return 1
-    return last_recipe.id + 1
+
+# Writers serialise on the lock and swap in new objects; readers never take it.
+# recipes maps id -> Recipe and is only changed one key at a time, published_ids
+# is an immutable tuple replaced on every publish/unpublish, and a Recipe is
+# copied before it is changed, so a reader never sees a half-updated recipe.
+#
+# After open() every change is also appended to a RecipeLog under the lock, so the
+# log order matches the store, and is acknowledged once the log has fsynced it.
+class RecipeStore:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.recipes = {}
+        self.published_ids = ()
+        self.log = None
+
+    def open(self, directory):
+        log = RecipeLog(directory)
+        records, last_id = log.load()
+
+        with self.lock:
+            self.recipes = {recipe_id: load_recipe(record) for recipe_id, record in records.items()}
+            self.published_ids = tuple(sorted(recipe_id for recipe_id, record in records.items()
+                                              if record['is_publish']))
+            self.last_id = max(self.last_id, last_id)
+            self.log = log
+
+    def next_id(self):
+        with self.lock:
+            self.last_id += 1
+            return self.last_id
+
+    def get(self, recipe_id):
+        return self.recipes.get(recipe_id)
+
+    def get_published(self):
+        recipes = self.recipes
+
+        published = (recipes.get(recipe_id) for recipe_id in self.published_ids)
+
+        return [recipe for recipe in published if recipe is not None]
+
+    def add(self, recipe):
+        with self.lock:
+            self._check()
+
+            self.recipes[recipe.id] = recipe
+
+            if recipe.is_publish:
+                self._set_published(recipe.id, True)
+
+            seq = self._write('put', recipe)
+
+        self._wait(seq)
+
+        return recipe
+
+    def update(self, recipe_id, **changes):
+        with self.lock:
+            self._check()
+
+            recipe = self.recipes.get(recipe_id)
+
+            if recipe is None:
+                return None
+
+            recipe = copy.copy(recipe)
+
+            for name, value in changes.items():
+                setattr(recipe, name, value)
+
+            self.recipes[recipe_id] = recipe
+
+            if 'is_publish' in changes:
+                self._set_published(recipe_id, recipe.is_publish)
+
+            seq = self._write('put', recipe)
+
+        self._wait(seq)
+
+        return recipe
+
+    def remove(self, recipe_id):
+        with self.lock:
+            self._check()
+
+            recipe = self.recipes.pop(recipe_id, None)
+
+            if recipe is None:
+                return None
+
+            self._set_published(recipe_id, False)
+
+            seq = self._write('delete', recipe)
+
+        self._wait(seq)
+
+        return recipe
+
+    def _check(self):
+        # A failed log refuses the write; refuse it before the store changes too
+        if self.log is not None:
+            self.log.check()
+
+    def _write(self, op, recipe):
+        if self.log is None:
+            return None
+
+        seq = self.log.write(op, recipe.id, vars(recipe))
+
+        if self.log.needs_snapshot():
+            # Recipes are never changed in place, so the snapshot can be written from a shallow copy
+            self.log.snapshot([vars(recipe) for recipe in self.recipes.values()], self.last_id)
+
+        return seq
+
+    def _wait(self, seq):
+        if seq is not None:
+            self.log.wait(seq)
+
+    def _set_published(self, recipe_id, is_publish):
+        published_ids = list(self.published_ids)
+
+        if is_publish and recipe_id not in self.published_ids:
+            # Ids only grow, so keeping them sorted keeps the creation order of the old list
+            insort(published_ids, recipe_id)
+        elif not is_publish and recipe_id in self.published_ids:
+            published_ids.remove(recipe_id)
+        else:
+            return
+
+        self.published_ids = tuple(published_ids)
+
+
+recipe_store = RecipeStore()
 
 
 class Recipe:
 
     def __init__(self, name, description, num_of_servings, cook_time, directions):
-        self.id = get_last_id()
+        self.id = recipe_store.next_id()
         self.name = name
         self.description = description
         self.num_of_servings = num_of_servings
@@ -30,3 +163,9 @@ class Recipe:
             'cook_time': self.cook_time,
             'directions': self.directions
         }
+
+
+def load_recipe(record):
+    recipe = Recipe.__new__(Recipe)
+    recipe.__dict__.update(record)
+    return recipe
@@ -5,13 +5,23 @@ from flask_migrate import Migrate
 from flask_restful import Api
 from flask_uploads import configure_uploads, patch_request_class
 
+from compression import compression
 from config import Config
 from extensions import db, jwt, image_set, cache, limiter
+from image_queue import image_queue
+from instrumentation import instrumentation
+from outbox import outbox
+from passwords import password_hasher
+from pools import pool_metrics
+from replicas import replica_router
+from revocation import revocation_store
+from static_files import static_files
 
 
 from resources.user import UserListResource, UserResource, MeResource, UserRecipeListResource, UserActivateResource, UserAvatarUploadResource
-from resources.token import TokenResource, RefreshResource, RevokeResource, black_list
-from resources.recipe import RecipeListResource, RecipeResource, RecipePublishResource, RecipeCoverUploadResource
+from resources.token import TokenResource, RefreshResource, RevokeResource
+from resources.recipe import RecipeListResource, RecipeBulkResource, RecipeExportResource, RecipeResource, RecipePublishResource, RecipeCoverUploadResource
+from resources.image import ImageVariantResource, ImageJobResource
 
 
 def create_app():
@@ -36,17 +46,44 @@ def create_app():
 
 def register_extensions(app):
     db.init_app(app)
+    pool_metrics.init_app(app)
+    replica_router.init_app(app)
     migrate = Migrate(app, db)
     jwt.init_app(app)
     configure_uploads(app, image_set)
+    static_files.init_app(app)
     patch_request_class(app, 10 * 1024 * 1024)
+    image_queue.init_app(app)
+    password_hasher.init_app(app)
+    outbox.init_app(app)
     cache.init_app(app)
     limiter.init_app(app)
+    revocation_store.init_app(app)
+    instrumentation.init_app(app)
+    compression.init_app(app)
+
+    @instrumentation.add_collector
+    def password_hasher_metrics():
+        stats = password_hasher.get_stats()
+
+        return [('smilecook_password_hash_pending', 'gauge', 'Password hashes waiting or running.', [({}, stats['pending'])]),
+                ('smilecook_password_hash_completed_total', 'counter', 'Password hashes completed.', [({}, stats['completed'])]),
+                ('smilecook_password_hash_rejected_total', 'counter', 'Password hashes rejected with 429.', [({}, stats['rejected'])]),
+                ('smilecook_password_hash_wait_seconds_total', 'counter', 'Time spent waiting on password hashes.',
+                 [({}, round(stats['wait_seconds'], 6))])]
+
+    instrumentation.add_collector(pool_metrics.collect)
+    instrumentation.add_collector(compression.collect)
+
+    @instrumentation.add_collector
+    def replica_metrics():
+        return [('smilecook_db_replica_healthy', 'gauge', 'Whether a read replica is in rotation.',
+                 [({'replica': bind}, int(healthy)) for bind, healthy in replica_router.get_stats().items()])]
 
     @jwt.token_in_blacklist_loader
     def check_if_token_in_blacklist(decrypted_token):
         jti = decrypted_token['jti']
-        return jti in black_list
+        return revocation_store.is_revoked(jti)
 
     # @limiter.request_filter
     # def ip_whitelist():
@@ -82,11 +119,17 @@ def register_resources(app):
     api.add_resource(RevokeResource, '/revoke')
 
     api.add_resource(RecipeListResource, '/recipes')
+    api.add_resource(RecipeBulkResource, '/recipes/bulk')
+    api.add_resource(RecipeExportResource, '/recipes/export')
     api.add_resource(RecipeResource, '/recipes/<int:recipe_id>')
     api.add_resource(RecipePublishResource, '/recipes/<int:recipe_id>/publish')
     api.add_resource(RecipeCoverUploadResource, '/recipes/<int:recipe_id>/cover')
 
+    api.add_resource(ImageJobResource, '/images/jobs/<string:job_id>')
+    api.add_resource(ImageVariantResource, '/images/<string:folder>/<string:variant>/<string:filename>')
+
 
 if __name__ == '__main__':
     app = create_app()
+    outbox.start()
     app.run()
@@ -0,0 +1,441 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from PIL import Image
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db, limiter
+from models.recipe import Recipe
+from models.user import User
+from resources.recipe import recipe_pagination_schema, recipe_schema
+from resources.user import user_public_schema
+from serializers import compile_schema, dump
+from utils import hash_password
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(num_users, num_recipes):
+
+    db.drop_all()
+    db.create_all()
+
+    hashed = hash_password(PASSWORD)
+
+    db.session.bulk_save_objects([User(username='user{}'.format(i),
+                                       email='user{}@example.com'.format(i),
+                                       password=hashed,
+                                       is_active=True) for i in range(1, num_users + 1)])
+    db.session.commit()
+
+    words = ['tomato', 'basil', 'garlic', 'onion', 'chicken', 'noodle', 'rice', 'lemon', 'pepper', 'cheese']
+
+    for start in range(0, num_recipes, 1000):
+        db.session.bulk_save_objects([Recipe(name='{} {}'.format(random.choice(words), i).title(),
+                                             description=' '.join(random.sample(words, 4)),
+                                             num_of_servings=random.randint(1, 10),
+                                             cook_time=random.randint(5, 240),
+                                             ingredients=' '.join(random.sample(words, 6)),
+                                             directions='Mix and cook. ' * 20,
+                                             is_publish=random.random() < 0.8,
+                                             user_id=random.randint(1, num_users))
+                                      for i in range(start, min(start + 1000, num_recipes))])
+        db.session.commit()
+
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+
+def make_image():
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (2400, 1600), (random.randint(0, 255), 120, 80)).save(buffer, format='PNG')
+
+    return buffer.getvalue()
+
+
+class Client:
+
+    def __init__(self, app=None, url=None):
+        self.app = app
+        self.url = url
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, json=None, files=None):
+
+        if self.app is not None:
+            client = getattr(self.local, 'client', None)
+            if client is None:
+                client = self.local.client = self.app.test_client()
+
+            if files:
+                data = {name: (io.BytesIO(content), filename) for name, (filename, content) in files.items()}
+                response = client.open(path, method=method, headers=headers, data=data,
+                                       content_type='multipart/form-data')
+            else:
+                response = client.open(path, method=method, headers=headers, json=json)
+
+            return response.status_code, response.get_json(silent=True)
+
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+
+        response = session.request(method, self.url + path, headers=headers, json=json, files=files)
+
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+def login(client, user_id):
+
+    status, data = client.request('POST', '/token', json={'email': 'user{}@example.com'.format(user_id),
+                                                          'password': PASSWORD})
+
+    return {'Authorization': 'Bearer {}'.format(data['access_token'])}
+
+
+def get_scenarios(client, num_users, num_recipes):
+
+    image = make_image()
+    auth = login(client, 1)
+
+    status, data = client.request('POST', '/recipes', headers=auth, json={'name': 'Benchmark cover recipe'})
+    own_recipe_id = data['id']
+
+    return {
+        'GET /recipes': lambda: ('GET', '/recipes?page={}'.format(random.randint(1, 50)), None, None, None),
+        'GET /recipes?q=': lambda: ('GET', '/recipes?q={}'.format(random.choice(['basil', 'rice', 'lemon'])), None, None, None),
+        'GET /recipes/<id>': lambda: ('GET', '/recipes/{}'.format(random.randint(1, num_recipes)), None, None, None),
+        'GET /users/<username>/recipes': lambda: ('GET', '/users/user{}/recipes'.format(random.randint(1, num_users)), None, None, None),
+        'POST /token': lambda: ('POST', '/token', None, {'email': 'user{}@example.com'.format(random.randint(1, num_users)),
+                                                         'password': PASSWORD}, None),
+        'PUT /recipes/<id>/cover': lambda: ('PUT', '/recipes/{}/cover'.format(own_recipe_id), auth, None,
+                                            {'cover': ('cover.png', image)}),
+        'PUT /users/avatar': lambda: ('PUT', '/users/avatar', auth, None, {'avatar': ('avatar.png', image)}),
+    }
+
+
+def percentile(values, percent):
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+
+    return values[index]
+
+
+def run_scenario(client, make_request, num_requests, concurrency, query_counter):
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def call(_):
+        method, path, headers, json, files = make_request()
+
+        start = time.perf_counter()
+        status, _ = client.request(method, path, headers=headers, json=json, files=files)
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    queries_before = query_counter[0]
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(num_requests)))
+
+    duration = time.perf_counter() - start
+
+    result = {
+        'requests': num_requests,
+        'statuses': statuses,
+        'throughput': round(num_requests / duration, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+    }
+
+    if query_counter[0] is not None:
+        result['queries_per_request'] = round((query_counter[0] - queries_before) / num_requests, 2)
+
+    return result
+
+
+def get_list_query_shapes(num_users):
+
+    shapes = {}
+
+    for sort in ['created_at', 'cook_time', 'num_of_servings']:
+        for order in ['asc', 'desc']:
+            shapes['published {} {}'.format(sort, order)] = \
+                lambda sort=sort, order=order: Recipe.get_all_published('', 3, 20, sort, order)
+            shapes['published {} {} cursor'.format(sort, order)] = \
+                lambda sort=sort, order=order: Recipe.get_all_published('', 1, 20, sort, order, cursor='')
+
+    for visibility in ['public', 'private', 'all']:
+        shapes['by user {}'.format(visibility)] = \
+            lambda visibility=visibility: Recipe.get_all_by_user(random.randint(1, num_users), 1, 10, visibility)
+
+    return shapes
+
+
+def explain_list_queries(app, num_users):
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    failures = 0
+
+    with app.test_request_context():
+
+        connection = db.engine.raw_connection()
+        explain = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+
+        for name, run in get_list_query_shapes(num_users).items():
+
+            del statements[:]
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                run()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+
+            for statement, parameters in statements:
+                cursor = connection.cursor()
+                cursor.execute(explain + statement, parameters)
+                plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+                cursor.close()
+
+                sequential = 'Seq Scan on recipe' in plan or any(
+                    line.split()[-2:] == ['SCAN', 'recipe'] or line.endswith('SCAN TABLE recipe')
+                    for line in plan.splitlines())
+
+                failures += sequential
+
+                print('{:<40} {}'.format(name, 'SEQUENTIAL SCAN' if sequential else 'index'))
+                if sequential:
+                    print(plan)
+
+        connection.close()
+
+    return failures
+
+
+def count_list_queries(app, num_users):
+
+    failures = 0
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.test_request_context():
+
+        # The user with the most recipes, so that every page size gets full pages
+        user_id, = db.session.query(Recipe.user_id).group_by(Recipe.user_id).\
+            order_by(db.func.count(Recipe.id).desc()).first()
+
+        lists = {
+            'published': lambda per_page: Recipe.get_all_published('', 1, per_page, 'created_at', 'desc'),
+            'by user': lambda per_page: Recipe.get_all_by_user(user_id, 1, per_page, 'all'),
+        }
+
+        for name, get_page in lists.items():
+            counts = {}
+
+            for per_page in [2, 10, 20]:
+                db.session.expunge_all()
+                del statements[:]
+
+                event.listen(db.engine, 'before_cursor_execute', capture)
+                try:
+                    # Serialising counts too: a lazy load per recipe would show up here
+                    dump(recipe_pagination_schema, get_page(per_page))
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', capture)
+
+                counts[per_page] = len(statements)
+
+            constant = len(set(counts.values())) == 1
+            failures += not constant
+
+            print('{:<16} {}{}'.format(name, ', '.join('per_page={} {} queries'.format(per_page, count)
+                                                       for per_page, count in counts.items()),
+                                       '' if constant else '  GROWS WITH PAGE SIZE'))
+
+    return failures
+
+
+def benchmark_serialization(app, per_page, iterations):
+
+    failures = 0
+
+    with app.test_request_context():
+
+        page = Recipe.get_all_published('', 1, per_page, 'created_at', 'desc')
+
+        cases = [('recipe page', recipe_pagination_schema, page),
+                 ('recipe', recipe_schema, page.items[0]),
+                 ('user', user_public_schema, page.items[0].user)]
+
+        print('{:<16} {:>14} {:>14} {:>8}'.format('schema', 'marshmallow', 'compiled', 'speedup'))
+
+        for name, schema, obj in cases:
+            dump_compiled = compile_schema(schema)
+
+            identical = json.dumps(schema.dump(obj).data) == json.dumps(dump_compiled(obj))
+            failures += not identical
+
+            timings = []
+            for dump_page in [lambda: schema.dump(obj).data, lambda: dump_compiled(obj)]:
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    dump_page()
+                timings.append((time.perf_counter() - start) / iterations)
+
+            print('{:<16} {:>12.3f}ms {:>12.3f}ms {:>7.1f}x{}'.format(
+                name, timings[0] * 1000, timings[1] * 1000, timings[0] / timings[1],
+                '' if identical else '  OUTPUT DIFFERS'))
+
+    return failures
+
+
+def compare(results, baseline):
+
+    print('\n{:<40} {:>10} {:>10} {:>10} {:>10}'.format('endpoint', 'p50', 'p95', 'p99', 'rps'))
+
+    for name, result in results['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+
+        def delta(key):
+            if not previous[key]:
+                return 'n/a'
+            return '{:+.1f}%'.format((result[key] - previous[key]) / previous[key] * 100)
+
+        print('{:<40} {:>10} {:>10} {:>10} {:>10}'.format(name, delta('p50_ms'), delta('p95_ms'),
+                                                           delta('p99_ms'), delta('throughput')))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Seed a database and benchmark the smilecook endpoints.')
+    parser.add_argument('--url', help='Benchmark a running server (e.g. gunicorn main:app) instead of the test client')
+    parser.add_argument('--database', default='sqlite:///benchmark.sqlite', help='Database to seed; its tables are dropped and recreated')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4],
+                        help='Concurrent clients; several values run each scenario at each level, '
+                             'e.g. to compare gunicorn worker classes with --url')
+    parser.add_argument('--endpoints', nargs='*', help='Only run these scenarios')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the existing data')
+    parser.add_argument('--output', default='benchmark_results', help='Directory the results are written to')
+    parser.add_argument('--compare', help='Previous results file to diff against')
+    parser.add_argument('--explain', action='store_true',
+                        help='Only check that the list queries use index scans on the seeded data')
+    parser.add_argument('--query-count', action='store_true',
+                        help='Only check that the list endpoints run the same number of queries for any per_page')
+    parser.add_argument('--serialization', action='store_true',
+                        help='Only compare the marshmallow and compiled serializers on a page of recipes')
+    args = parser.parse_args()
+
+    if args.url is not None and 'X-RateLimit-Limit' in requests.get(args.url + '/recipes').headers:
+        sys.exit('{} rate limits requests, so most latencies would time 429s; '
+                 'start it with RATELIMIT_ENABLED=false'.format(args.url))
+
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    # Only the test client; a server started for --url needs RATELIMIT_ENABLED=false
+    limiter.enabled = False
+
+    query_counter = [None]
+
+    with app.app_context():
+
+        if not args.no_seed:
+            seed(args.users, args.recipes)
+
+        if args.url is None:
+            query_counter[0] = 0
+
+            def count_query(*args):
+                query_counter[0] += 1
+
+            event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    if args.explain:
+        sys.exit(1 if explain_list_queries(app, args.users) else 0)
+
+    if args.query_count:
+        sys.exit(1 if count_list_queries(app, args.users) else 0)
+
+    if args.serialization:
+        sys.exit(1 if benchmark_serialization(app, per_page=100, iterations=args.requests) else 0)
+
+    client = Client(app=app if args.url is None else None, url=args.url)
+
+    scenarios = get_scenarios(client, args.users, args.recipes)
+
+    results = {
+        'created_at': datetime.utcnow().isoformat(),
+        'target': args.url or 'test_client',
+        'database': args.database,
+        'users': args.users,
+        'recipes': args.recipes,
+        'concurrency': args.concurrency,
+        'endpoints': {}
+    }
+
+    for (scenario, make_request), concurrency in itertools.product(scenarios.items(), args.concurrency):
+        if args.endpoints and scenario not in args.endpoints:
+            continue
+
+        name = scenario if len(args.concurrency) == 1 else '{} c={}'.format(scenario, concurrency)
+
+        result = run_scenario(client, make_request, args.requests, concurrency, query_counter)
+        results['endpoints'][name] = result
+
+        print('{:<40} p50={p50_ms}ms p95={p95_ms}ms p99={p99_ms}ms {throughput} req/s '
+              'queries={queries} {statuses}'.format(name, queries=result.get('queries_per_request', '-'), **result))
+
+        if '429' in result['statuses']:
+            print('  warning: {} of {} requests were rejected with 429, the latencies include them'.format(
+                result['statuses']['429'], result['requests']), file=sys.stderr)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_path = os.path.join(args.output, '{}.json'.format(datetime.utcnow().strftime('%Y%m%d-%H%M%S')))
+
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print('\nResults written to {}'.format(output_path))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
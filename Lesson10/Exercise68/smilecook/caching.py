@@ -0,0 +1,151 @@
+import functools
+import hashlib
+import os
+import pickle
+import threading
+import time
+import uuid
+
+from flask import current_app, g, request
+
+from conditional import get_validator_headers, is_modified, make_etag, not_modified
+from extensions import cache
+
+TAG_PREFIX = 'tag/'
+VIEW_PREFIX = 'view/'
+
+sweep_lock = threading.Lock()
+last_sweep = 0.0
+
+
+def make_view_key():
+
+    query_args = sorted(request.args.items(multi=True))
+    digest = hashlib.md5(repr(query_args).encode()).hexdigest()
+
+    return '{}{}?{}'.format(VIEW_PREFIX, request.path, digest)
+
+
+def get_tag_versions(tags, create=False):
+
+    tags = sorted(set(tags))
+    keys = [TAG_PREFIX + tag for tag in tags]
+
+    versions = dict(zip(tags, cache.get_many(*keys))) if keys else {}
+
+    if create:
+        for tag, key in zip(tags, keys):
+            if versions[tag] is None:
+                # Random versions instead of counters so an evicted tag can never match an old entry
+                cache.add(key, uuid.uuid4().hex, timeout=0)
+                versions[tag] = cache.get(key)
+
+    return versions
+
+
+def remove_expired_files(directory):
+
+    now = time.time()
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+
+        try:
+            with open(path, 'rb') as f:
+                expires = pickle.load(f)
+
+            # Tag versions never expire (timeout 0)
+            if expires != 0 and expires <= now:
+                os.remove(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+
+def sweep_expired_entries():
+    global last_sweep
+
+    # CACHE_THRESHOLD = 0 turns off FileSystemCache's pruning, which scanned every file on
+    # each write past the threshold and evicted every third one, tag versions included
+    interval = current_app.config.get('CACHE_SWEEP_INTERVAL')
+
+    if current_app.config.get('CACHE_TYPE') != 'filesystem' or not interval:
+        return
+
+    with sweep_lock:
+        now = time.time()
+
+        if now - last_sweep < interval:
+            return
+
+        last_sweep = now
+
+    threading.Thread(target=remove_expired_files, args=(current_app.config['CACHE_DIR'], ), daemon=True).start()
+
+
+def invalidate(*tags):
+
+    for tag in set(tags):
+        cache.set(TAG_PREFIX + tag, uuid.uuid4().hex, timeout=0)
+
+
+def cached(timeout, tags, dynamic_tags=None):
+
+    def decorator(f):
+
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+
+            key = make_view_key()
+
+            entry = cache.get(key)
+
+            if entry is not None and 'etag' in entry and get_tag_versions(entry['versions']) == entry['versions']:
+                if not is_modified(entry['etag']):
+                    return not_modified(entry['etag'])
+
+                # Lets the compression layer reuse the compressed body cached for this etag
+                g.cached_view = (entry['etag'], timeout)
+
+                data, status, headers = entry['value']
+                return data, status, dict(headers, **get_validator_headers(entry['etag']))
+
+            versions = get_tag_versions(tags, create=True)
+
+            value = f(*args, **kwargs)
+
+            data, status, headers = value if len(value) == 3 else value + ({}, )
+
+            if status != 200:
+                return value
+
+            if dynamic_tags is not None:
+                versions.update(get_tag_versions(dynamic_tags(data), create=True))
+
+            # The etag is the hash of the cached page, so a revalidation never has to load or dump it again
+            etag = make_etag(data)
+
+            cache.set(key, {'versions': versions, 'value': (data, status, headers), 'etag': etag}, timeout=timeout)
+            sweep_expired_entries()
+
+            if not is_modified(etag):
+                return not_modified(etag)
+
+            g.cached_view = (etag, timeout)
+
+            return data, status, dict(headers, **get_validator_headers(etag))
+
+        return decorated_function
+
+    return decorator
+
+
+def recipe_list_tags(data):
+
+    tags = []
+
+    for recipe in data.get('data', []):
+        tags.append('recipe:{}'.format(recipe['id']))
+        if recipe.get('author'):
+            tags.append('user:{}'.format(recipe['author']['id']))
+
+    return tags
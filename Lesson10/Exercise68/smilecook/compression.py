@@ -0,0 +1,136 @@
+import gzip
+import threading
+
+from flask import g, request
+
+from extensions import cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_PREFIX = 'compressed/'
+
+
+def compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=level)
+
+
+def compress_brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# Preferred first when the client accepts several with the same quality
+COMPRESSORS = [('br', compress_brotli, brotli), ('zstd', compress_zstd, zstandard), ('gzip', compress_gzip, gzip)]
+
+
+class Compression:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encodings = {}
+        self.min_size = None
+        self.levels = {}
+        self.cached_levels = {}
+        self.stats = {}
+
+    def init_app(self, app):
+        self.encodings = {encoding: compress for encoding, compress, module in COMPRESSORS
+                          if module is not None and encoding in app.config.get('COMPRESS_ALGORITHMS', [])}
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.levels = app.config.get('COMPRESS_LEVELS', {})
+        self.cached_levels = app.config.get('COMPRESS_CACHED_LEVELS', {})
+
+        app.after_request(self.after_request)
+
+    def choose_encoding(self):
+
+        accept = request.accept_encodings
+        preference = list(self.encodings)
+
+        qualities = [(accept.quality(encoding), -preference.index(encoding), encoding) for encoding in preference]
+        quality, _, encoding = max(qualities, default=(0, 0, None))
+
+        return encoding if quality > 0 else None
+
+    def after_request(self, response):
+
+        # Files and streams (exports) are left alone; static text assets have precompressed copies
+        if response.direct_passthrough or response.is_streamed or response.status_code != 200 \
+                or 'Content-Encoding' in response.headers or response.mimetype not in self.levels:
+            return response
+
+        data = response.get_data()
+
+        if len(data) < self.min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = self.choose_encoding()
+
+        if encoding is None:
+            return response
+
+        cached_view = g.get('cached_view')
+
+        if cached_view is not None:
+            # Cached pages are compressed once at a higher level and shared by every worker
+            etag, timeout = cached_view
+            key = '{}{}/{}/{}'.format(COMPRESSED_PREFIX, encoding, response.mimetype, etag)
+
+            compressed = cache.get(key)
+
+            if compressed is None:
+                compressed = self.encodings[encoding](data, self.cached_levels[encoding])
+                cache.set(key, compressed, timeout=timeout)
+                self.observe(encoding, len(data), len(compressed), hit=False)
+            else:
+                self.observe(encoding, len(data), len(compressed), hit=True)
+        else:
+            compressed = self.encodings[encoding](data, self.levels[response.mimetype][encoding])
+            self.observe(encoding, len(data), len(compressed), hit=None)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed bytes are a different representation of the same content
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+    def observe(self, encoding, size, compressed_size, hit):
+        with self.lock:
+            stats = self.stats.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cache_hits': 0})
+            stats['responses'] += 1
+            stats['bytes_in'] += size
+            stats['bytes_out'] += compressed_size
+            stats['cache_hits'] += int(bool(hit))
+
+    def collect(self):
+        with self.lock:
+            stats = sorted((encoding, dict(s)) for encoding, s in self.stats.items())
+
+        return [('smilecook_compressed_responses_total', 'counter', 'Responses compressed.',
+                 [({'encoding': encoding}, s['responses']) for encoding, s in stats]),
+                ('smilecook_compression_bytes_in_total', 'counter', 'Response bytes before compression.',
+                 [({'encoding': encoding}, s['bytes_in']) for encoding, s in stats]),
+                ('smilecook_compression_bytes_out_total', 'counter', 'Response bytes after compression.',
+                 [({'encoding': encoding}, s['bytes_out']) for encoding, s in stats]),
+                ('smilecook_compression_cache_hits_total', 'counter', 'Compressed bodies served from the cache.',
+                 [({'encoding': encoding}, s['cache_hits']) for encoding, s in stats])]
+
+
+compression = Compression()
@@ -0,0 +1,32 @@
+import hashlib
+import json
+from http import HTTPStatus
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified
+
+
+def make_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def has_validators():
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def get_validator_headers(etag, last_modified=None):
+
+    headers = {'ETag': '"{}"'.format(etag)}
+
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    return headers
+
+
+def is_modified(etag, last_modified=None):
+    return is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def not_modified(etag, last_modified=None):
+    return Response(status=HTTPStatus.NOT_MODIFIED, headers=get_validator_headers(etag, last_modified))
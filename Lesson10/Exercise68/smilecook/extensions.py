@@ -1,12 +1,13 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_uploads import UploadSet, IMAGES
 from flask_caching import Cache
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 
-db = SQLAlchemy()
+from ratelimit import get_rate_limit_key
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 jwt = JWTManager()
 image_set = UploadSet('images', IMAGES)
 cache = Cache()
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_rate_limit_key)
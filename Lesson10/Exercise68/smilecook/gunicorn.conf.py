@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# 'sync' handles one request per worker. 'gevent' runs each request in a greenlet and
+# switches on every socket wait (DB queries, Mailgun, Redis), so a worker keeps serving
+# up to worker_connections requests while others wait on I/O.
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+
+# More than one thread turns the sync worker into gthread
+threads = int(os.environ.get('WEB_THREADS', 1))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+
+def post_fork(server, worker):
+
+    if worker_class == 'gevent':
+        # psycopg2 is a C extension that gevent cannot patch; make it wait through the event loop
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Send what is still pending from before a restart without waiting for a new signup
+    from outbox import outbox
+    outbox.start()
@@ -0,0 +1,110 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+from flask_uploads import extension
+
+from extensions import cache, db, image_set
+from utils import compress_image_file
+
+JOB_PREFIX = 'image_job/'
+JOB_TIMEOUT = 24 * 60 * 60
+
+
+def get_job(job_id):
+    return cache.get(JOB_PREFIX + job_id)
+
+
+def set_job(job_id, status, error=None):
+    cache.set(JOB_PREFIX + job_id, {'id': job_id, 'status': status, 'error': error}, timeout=JOB_TIMEOUT)
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class ImageQueue:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.completions = None
+        self.enabled = False
+        self.max_workers = 1
+
+    def init_app(self, app):
+        self.enabled = app.config.get('IMAGE_PROCESSING_ASYNC', False)
+        self.max_workers = app.config.get('IMAGE_PROCESSING_WORKERS', self.max_workers)
+
+    def get_executor(self):
+        # Created lazily so that each gunicorn worker forks its own pool after startup
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        return self.executor
+
+    def get_completions(self):
+        # on_complete writes to the DB; running it on the pool's result thread would swallow its errors
+        with self.lock:
+            if self.completions is None:
+                self.completions = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-completion')
+
+        return self.completions
+
+    def submit(self, image, folder, on_complete):
+        # Returns None when the image is already processed, else the id of a job for ImageJobResource
+
+        filename = '{}.{}'.format(uuid.uuid4(), extension(image.filename))
+        image_set.save(image, folder=folder, name=filename)
+
+        file_path = image_set.path(filename=filename, folder=folder)
+
+        compressed_filename = '{}.jpg'.format(uuid.uuid4())
+        compressed_file_path = image_set.path(filename=compressed_filename, folder=folder)
+
+        if not self.enabled:
+            try:
+                compress_image_file(file_path, compressed_file_path)
+            finally:
+                remove_file(file_path)
+            on_complete(compressed_filename)
+            return None
+
+        app = current_app._get_current_object()
+        job_id = uuid.uuid4().hex
+
+        set_job(job_id, 'pending')
+
+        def complete(future):
+            with app.app_context():
+                try:
+                    error = future.exception()
+
+                    if error is not None:
+                        app.logger.error('Compressing %s failed: %s', file_path, error)
+                        remove_file(file_path)
+                        remove_file(compressed_file_path)
+                        set_job(job_id, 'failed', 'The image could not be processed')
+                        return
+
+                    on_complete(compressed_filename)
+                    set_job(job_id, 'done')
+                except Exception:
+                    app.logger.exception('Saving %s failed', compressed_file_path)
+                    db.session.rollback()
+                    remove_file(compressed_file_path)
+                    set_job(job_id, 'failed', 'The image could not be saved')
+                finally:
+                    db.session.remove()
+
+        future = self.get_executor().submit(compress_image_file, file_path, compressed_file_path)
+        future.add_done_callback(lambda future: self.get_completions().submit(complete, future))
+
+        return job_id
+
+
+image_queue = ImageQueue()
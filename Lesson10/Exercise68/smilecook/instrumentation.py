@@ -0,0 +1,207 @@
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.exceptions import Forbidden
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Weight of the latest request in the moving average of DB time per request
+DB_LATENCY_SMOOTHING = 0.1
+
+
+class EndpointMetrics:
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.total_time = 0.0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.db_latency = None
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def observe(self, timings):
+        self.requests += 1
+        self.queries += timings['queries']
+        self.total_time += timings['total']
+        self.db_time += timings['db']
+        self.serialize_time += timings['serialize']
+
+        if self.db_latency is None:
+            self.db_latency = timings['db']
+        else:
+            self.db_latency += DB_LATENCY_SMOOTHING * (timings['db'] - self.db_latency)
+
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if timings['total'] <= bound:
+                self.buckets[i] += 1
+
+
+class Instrumentation:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.collectors = []
+        self.slow_query_threshold = None
+        self.logger = None
+        self.allowed_ips = []
+        self.token = None
+
+    def init_app(self, app):
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD')
+        self.logger = app.logger
+        self.allowed_ips = app.config.get('METRICS_ALLOWED_IPS', [])
+        self.token = app.config.get('METRICS_TOKEN')
+
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+        if app.config.get('METRICS_ENABLED'):
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def get_db_latency(self, endpoint):
+        with self.lock:
+            metrics = self.endpoints.get(endpoint)
+            return metrics.db_latency if metrics is not None else None
+
+    def before_request(self):
+        g.timings = {'start': time.perf_counter(), 'queries': 0, 'db': 0.0, 'serialize': 0.0}
+
+    def after_request(self, response):
+        timings = g.pop('timings', None)
+
+        if timings is None:
+            return response
+
+        timings['total'] = time.perf_counter() - timings['start']
+
+        response.headers['Server-Timing'] = 'db;dur={:.2f};desc="{} queries", serialize;dur={:.2f}, total;dur={:.2f}'.format(
+            timings['db'] * 1000, timings['queries'], timings['serialize'] * 1000, timings['total'] * 1000)
+
+        with self.lock:
+            self.endpoints.setdefault(request.endpoint or 'unknown', EndpointMetrics()).observe(timings)
+
+        return response
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            if has_request_context() and 'timings' in g:
+                g.timings[name] += time.perf_counter() - start
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+
+        if has_request_context() and 'timings' in g:
+            g.timings['queries'] += 1
+            g.timings['db'] += elapsed
+
+        if self.slow_query_threshold is not None and elapsed > self.slow_query_threshold:
+            self.log_slow_query(conn, statement, parameters, elapsed)
+
+    def handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute. Without an execution context
+        # it failed while being compiled, before before_cursor_execute pushed its start.
+        query_start = context.connection.info.get('query_start') if context.connection is not None else None
+
+        if context.execution_context is not None and query_start:
+            query_start.pop()
+
+    def log_slow_query(self, conn, statement, parameters, elapsed):
+        plan = None
+
+        if statement.lstrip().upper().startswith('SELECT'):
+            explain = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+            explain_cursor = conn.connection.cursor()
+            try:
+                explain_cursor.execute(explain + statement, parameters)
+                plan = '\n'.join(' '.join(str(column) for column in row) for row in explain_cursor.fetchall())
+            except Exception as e:
+                plan = 'EXPLAIN failed: {}'.format(e)
+            finally:
+                explain_cursor.close()
+
+        self.logger.warning('Slow query (%.1f ms) on %s:\n%s\nParameters: %r\nPlan:\n%s',
+                            elapsed * 1000, request.endpoint if has_request_context() else '-',
+                            statement, parameters, plan)
+
+    def render(self):
+        lines = []
+
+        def sample(name, labels, value):
+            label_text = ','.join('{}="{}"'.format(key, value) for key, value in labels.items())
+            lines.append('{}{{{}}} {}'.format(name, label_text, value) if label_text else '{} {}'.format(name, value))
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            # Histograms from collectors add a suffix (_bucket, _sum, _count) to their samples
+            for labels, value, *suffix in samples:
+                sample(name + ''.join(suffix), labels, value)
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+
+            metric('smilecook_requests_total', 'counter', 'Requests handled.',
+                   [({'endpoint': name}, m.requests) for name, m in endpoints])
+            metric('smilecook_db_queries_total', 'counter', 'SQL statements executed.',
+                   [({'endpoint': name}, m.queries) for name, m in endpoints])
+            metric('smilecook_db_seconds_total', 'counter', 'Time spent executing SQL.',
+                   [({'endpoint': name}, round(m.db_time, 6)) for name, m in endpoints])
+            metric('smilecook_serialize_seconds_total', 'counter', 'Time spent serialising responses.',
+                   [({'endpoint': name}, round(m.serialize_time, 6)) for name, m in endpoints])
+
+            metric('smilecook_db_latency_seconds', 'gauge', 'Moving average of SQL time per request.',
+                   [({'endpoint': name}, round(m.db_latency, 6)) for name, m in endpoints if m.db_latency is not None])
+
+            metric('smilecook_request_duration_seconds', 'histogram', 'Request duration.', [])
+            for name, m in endpoints:
+                for bound, count in zip(DURATION_BUCKETS, m.buckets):
+                    sample('smilecook_request_duration_seconds_bucket', {'endpoint': name, 'le': bound}, count)
+                sample('smilecook_request_duration_seconds_bucket', {'endpoint': name, 'le': '+Inf'}, m.requests)
+                sample('smilecook_request_duration_seconds_sum', {'endpoint': name}, round(m.total_time, 6))
+                sample('smilecook_request_duration_seconds_count', {'endpoint': name}, m.requests)
+
+        for collector in self.collectors:
+            for name, metric_type, help_text, samples in collector():
+                metric(name, metric_type, help_text, samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def is_authorized(self):
+        authorization = request.headers.get('Authorization', '')
+
+        if self.token and hmac.compare_digest(authorization, 'Bearer {}'.format(self.token)):
+            return True
+
+        return request.remote_addr in self.allowed_ips
+
+    def metrics_view(self):
+        if not self.is_authorized():
+            raise Forbidden()
+
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
@@ -1,3 +1,5 @@
+import json
+
 import requests
 
 
@@ -5,12 +7,15 @@ class MailgunApi:
 
     API_URL = 'https://api.mailgun.net/v3/{}/messages'
 
-    def __init__(self, domain, api_key):
+    def __init__(self, domain, api_key, api_url=None, timeout=10):
         self.domain = domain
         self.key = api_key
-        self.base_url = self.API_URL.format(self.domain)
+        self.base_url = (api_url or self.API_URL).format(self.domain)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = ('api', self.key)
 
-    def send_email(self, to, subject, text, html=None):
+    def send_email(self, to, subject, text, html=None, recipient_variables=None):
 
         if not isinstance(to, (list, tuple)):
             to = [to, ]
@@ -23,8 +28,14 @@ class MailgunApi:
             'html': html
         }
 
-        response = requests.post(url=self.base_url,
-                                 auth=('api', self.key),
-                                 data=data)
+        if len(to) > 1 or recipient_variables:
+            # Batch sending: each recipient only sees their own address, and %recipient.<name>%
+            # in text and html is replaced with their own values
+            recipient_variables = recipient_variables or {}
+            data['recipient-variables'] = json.dumps({address: recipient_variables.get(address, {}) for address in to})
+
+        response = self.session.post(url=self.base_url,
+                                     data=data,
+                                     timeout=self.timeout)
 
         return response
@@ -0,0 +1,38 @@
+"""recipe full-text search indexes
+
+Revision ID: a3f1c9d2b7e4
+Revises: 7d7d6df19aa8
+Create Date: 2026-10-18 10:15:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2b7e4'
+down_revision = '7d7d6df19aa8'
+branch_labels = None
+depends_on = None
+
+
+# Must match search.recipe_document so the planner can use the indexes
+RECIPE_DOCUMENT = "(coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || coalesce(ingredients, ''))"
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("CREATE INDEX ix_recipe_search_vector ON recipe "
+               "USING gin (to_tsvector('english', {}))".format(RECIPE_DOCUMENT))
+    op.execute("CREATE INDEX ix_recipe_search_trgm ON recipe "
+               "USING gin ({} gin_trgm_ops)".format(RECIPE_DOCUMENT))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('DROP INDEX IF EXISTS ix_recipe_search_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_recipe_search_vector')
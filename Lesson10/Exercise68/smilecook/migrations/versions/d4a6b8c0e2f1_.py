@@ -0,0 +1,37 @@
+"""recipe list indexes
+
+Revision ID: d4a6b8c0e2f1
+Revises: c9d1e3f5a7b2
+Create Date: 2026-10-18 13:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a6b8c0e2f1'
+down_revision = 'c9d1e3f5a7b2'
+branch_labels = None
+depends_on = None
+
+
+PUBLISHED_SORT_COLUMNS = ['created_at', 'cook_time', 'num_of_servings']
+
+
+def upgrade():
+    for column in PUBLISHED_SORT_COLUMNS:
+        op.create_index('ix_recipe_published_{}'.format(column), 'recipe', [column, 'id'], unique=False,
+                        postgresql_where=sa.text('is_publish IS true'),
+                        sqlite_where=sa.text('is_publish IS 1'))
+
+    op.create_index('ix_recipe_user_id_is_publish_created_at', 'recipe', ['user_id', 'is_publish', 'created_at', 'id'], unique=False)
+    op.create_index('ix_recipe_user_id_created_at', 'recipe', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_recipe_user_id_created_at', table_name='recipe')
+    op.drop_index('ix_recipe_user_id_is_publish_created_at', table_name='recipe')
+
+    for column in reversed(PUBLISHED_SORT_COLUMNS):
+        op.drop_index('ix_recipe_published_{}'.format(column), table_name='recipe')
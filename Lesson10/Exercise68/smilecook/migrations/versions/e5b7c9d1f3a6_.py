@@ -0,0 +1,23 @@
+"""revoked token created_at index
+
+Revision ID: e5b7c9d1f3a6
+Revises: d4a6b8c0e2f1
+Create Date: 2026-10-19 09:20:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7c9d1f3a6'
+down_revision = 'd4a6b8c0e2f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_revoked_token_created_at'), 'revoked_token', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_revoked_token_created_at'), table_name='revoked_token')
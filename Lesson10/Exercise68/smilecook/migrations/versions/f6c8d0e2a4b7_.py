@@ -0,0 +1,24 @@
+"""outbox email recipient variables
+
+Revision ID: f6c8d0e2a4b7
+Revises: e5b7c9d1f3a6
+Create Date: 2026-10-19 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c8d0e2a4b7'
+down_revision = 'e5b7c9d1f3a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('outbox_email', sa.Column('variables', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('outbox_email', 'variables')
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from extensions import db
+
+
+class OutboxEmail(db.Model):
+    __tablename__ = 'outbox_email'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    text = db.Column(db.Text(), nullable=False)
+    html = db.Column(db.Text())
+    variables = db.Column(db.Text())
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer(), nullable=False, default=0)
+    last_error = db.Column(db.String(200))
+    next_attempt_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime())
+
+    created_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now())
+
+    __table_args__ = (db.Index('ix_outbox_email_status_next_attempt_at', 'status', 'next_attempt_at'), )
+
+    @classmethod
+    def get_due(cls, limit):
+        return cls.query.filter(cls.status == 'pending', cls.next_attempt_at <= datetime.utcnow()). \
+            order_by(cls.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
@@ -1,6 +1,12 @@
 from extensions import db
 
-from sqlalchemy import asc, desc, or_
+from sqlalchemy import asc, desc, event
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models.user import User
+from pagination import keyset_paginate
+from search import search_recipes, refresh_inverted_index, update_inverted_index, remove_from_inverted_index, \
+    apply_inverted_index_changes, discard_inverted_index_changes
 
 
 class Recipe(db.Model):
@@ -21,38 +27,120 @@ class Recipe(db.Model):
 
     user_id = db.Column(db.Integer(), db.ForeignKey("user.id"))
 
+    # Match the list query shapes in get_all_published / get_all_by_user, see migration d4a6b8c0e2f1
+    __table_args__ = (
+        db.Index('ix_recipe_published_created_at', 'created_at', 'id',
+                 postgresql_where=db.text('is_publish IS true'), sqlite_where=db.text('is_publish IS 1')),
+        db.Index('ix_recipe_published_cook_time', 'cook_time', 'id',
+                 postgresql_where=db.text('is_publish IS true'), sqlite_where=db.text('is_publish IS 1')),
+        db.Index('ix_recipe_published_num_of_servings', 'num_of_servings', 'id',
+                 postgresql_where=db.text('is_publish IS true'), sqlite_where=db.text('is_publish IS 1')),
+        db.Index('ix_recipe_user_id_is_publish_created_at', 'user_id', 'is_publish', 'created_at', 'id'),
+        db.Index('ix_recipe_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
+
     @classmethod
-    def get_all_published(cls, q, page, per_page, sort, order):
+    def get_all_published(cls, q, page, per_page, sort, order, cursor=None):
+
+        query = cls.query.options(joinedload('user')).filter(cls.is_publish.is_(True))
+
+        if q:
+            query = search_recipes(cls, query, q, ranked=(sort == 'relevance' and cursor is None))
 
-        keyword = '%{keyword}%'.format(keyword=q)
+        if sort == 'relevance':
+            sort = 'created_at'
+            order = 'desc'
+
+        if cursor is not None:
+            return keyset_paginate(query, getattr(cls, sort), cls.id, order == 'asc', per_page, cursor)
 
         if order == 'asc':
             sort_logic = asc(getattr(cls, sort))
         else:
             sort_logic = desc(getattr(cls, sort))
 
-        return cls.query.filter(or_(cls.name.ilike(keyword),
-                                    cls.description.ilike(keyword),
-                                    cls.ingredients.ilike(keyword)),
-                                cls.is_publish.is_(True)). \
-            order_by(sort_logic).paginate(page=page, per_page=per_page)
+        return query.order_by(sort_logic).paginate(page=page, per_page=per_page)
 
     @classmethod
-    def get_all_by_user(cls, user_id, page, per_page, visibility='public'):
+    def get_all_by_user(cls, user_id, page, per_page, visibility='public', cursor=None):
 
-        query = cls.query.filter_by(user_id=user_id)
+        query = cls.query.options(joinedload('user')).filter_by(user_id=user_id)
 
         if visibility == 'public':
-            query = cls.query.filter_by(user_id=user_id, is_publish=True)
+            query = query.filter_by(is_publish=True)
         elif visibility == 'private':
-            query = cls.query.filter_by(user_id=user_id, is_publish=False)
+            query = query.filter_by(is_publish=False)
+
+        if cursor is not None:
+            return keyset_paginate(query, cls.created_at, cls.id, False, per_page, cursor)
 
         return query.order_by(desc(cls.created_at)).paginate(page=page, per_page=per_page)
 
+    @classmethod
+    def get_all_for_export(cls, user_id=None, batch_size=500):
+
+        # The author comes from the same query; joinedload is not allowed together with yield_per
+        query = cls.query.outerjoin(cls.user).options(contains_eager(cls.user))
+
+        if user_id is None:
+            query = query.filter(cls.is_publish.is_(True))
+        else:
+            query = query.filter(cls.user_id == user_id)
+
+        return query.order_by(cls.id).execution_options(stream_results=True).yield_per(batch_size)
+
     @classmethod
     def get_by_id(cls, recipe_id):
         return cls.query.filter_by(id=recipe_id).first()
 
+    @classmethod
+    def get_version(cls, recipe_id):
+        return db.session.query(cls.is_publish, cls.user_id, cls.updated_at,
+                                User.updated_at.label('user_updated_at')).\
+            outerjoin(User, cls.user_id == User.id).filter(cls.id == recipe_id).first()
+
+    @classmethod
+    def get_owners(cls, recipe_ids):
+        return dict(db.session.query(cls.id, cls.user_id).filter(cls.id.in_(recipe_ids)))
+
+    @classmethod
+    def bulk_write(cls, creates, updates, publish_ids, unpublish_ids):
+
+        # One transaction and one statement per kind of write instead of a commit per recipe
+        if creates:
+            dialect = db.session.get_bind(cls.__mapper__).dialect
+
+            if dialect.implicit_returning and dialect.supports_multivalues_insert:
+                # A multi-row INSERT ... VALUES needs the same columns in every row
+                columns = [column for column in cls.__table__.columns
+                           if any(column.key in mapping for mapping in creates)]
+                rows = [{column.key: mapping.get(column.key, column.default.arg if column.default is not None else None)
+                         for column in columns} for mapping in creates]
+
+                result = db.session.execute(cls.__table__.insert().values(rows).returning(cls.id))
+
+                # PostgreSQL returns the rows of INSERT ... VALUES in order
+                for mapping, (recipe_id, ) in zip(creates, result):
+                    mapping['id'] = recipe_id
+            else:
+                # Without RETURNING, return_defaults makes this one INSERT per row to read each id
+                db.session.bulk_insert_mappings(cls, creates, return_defaults=True)
+
+        if updates:
+            db.session.bulk_update_mappings(cls, updates)
+
+        if publish_ids:
+            cls.query.filter(cls.id.in_(publish_ids)).update({'is_publish': True}, synchronize_session=False)
+
+        if unpublish_ids:
+            cls.query.filter(cls.id.in_(unpublish_ids)).update({'is_publish': False}, synchronize_session=False)
+
+        db.session.commit()
+
+        refresh_inverted_index(cls, [mapping['id'] for mapping in creates + updates])
+
+        return [mapping['id'] for mapping in creates]
+
     def save(self):
         db.session.add(self)
         db.session.commit()
@@ -60,3 +148,10 @@ class Recipe(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+
+
+event.listen(Recipe, 'after_insert', update_inverted_index)
+event.listen(Recipe, 'after_update', update_inverted_index)
+event.listen(Recipe, 'after_delete', remove_from_inverted_index)
+event.listen(db.session, 'after_commit', apply_inverted_index_changes)
+event.listen(db.session, 'after_rollback', discard_inverted_index_changes)
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from extensions import db
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_token'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime(), nullable=False, index=True)
+
+    created_at = db.Column(db.DateTime(), nullable=False, server_default=db.func.now(), index=True)
+
+    @classmethod
+    def get_by_jti(cls, jti):
+        return cls.query.filter_by(jti=jti).first()
+
+    @classmethod
+    def get_since(cls, created_at):
+        query = db.session.query(cls.jti, cls.created_at)
+
+        if created_at is not None:
+            query = query.filter(cls.created_at >= created_at)
+
+        return query.all()
+
+    @classmethod
+    def get_all_active(cls):
+        return db.session.query(cls.jti, cls.created_at).filter(cls.expires_at > datetime.utcnow()).all()
+
+    @classmethod
+    def delete_expired(cls):
+        cls.query.filter(cls.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+        db.session.commit()
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
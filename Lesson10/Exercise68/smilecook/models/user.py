@@ -20,6 +20,10 @@ class User(db.Model):
     def get_by_username(cls, username):
         return cls.query.filter_by(username=username).first()
 
+    @classmethod
+    def get_version(cls, username):
+        return db.session.query(cls.id, cls.updated_at).filter_by(username=username).first()
+
     @classmethod
     def get_by_email(cls, email):
         return cls.query.filter_by(email=email).first()
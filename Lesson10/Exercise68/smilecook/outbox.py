@@ -0,0 +1,149 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+from extensions import db
+from mailgun import MailgunApi
+from models.outbox_email import OutboxEmail
+
+
+class Outbox:
+
+    def __init__(self):
+        self.app = None
+        self.mailgun = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = None
+
+    def init_app(self, app):
+        self.app = app
+        self.mailgun = MailgunApi(domain=app.config.get('MAILGUN_DOMAIN'),
+                                  api_key=app.config.get('MAILGUN_API_KEY'),
+                                  api_url=app.config.get('MAILGUN_API_URL'),
+                                  timeout=app.config['MAILGUN_TIMEOUT'])
+
+    def enqueue(self, to, subject, text, html=None, variables=None, commit=True):
+        # Per-recipient values go in variables ({address: {name: value}}) and are referenced as
+        # %recipient.name% in text and html, so emails that only differ in them are sent in one batch.
+        # With commit=False the emails are committed with the caller's changes, which then calls notify().
+
+        if not isinstance(to, (list, tuple)):
+            to = [to, ]
+
+        variables = variables or {}
+
+        for recipient in to:
+            db.session.add(OutboxEmail(recipient=recipient, subject=subject, text=text, html=html,
+                                       variables=json.dumps(variables[recipient]) if recipient in variables else None))
+
+        if commit:
+            db.session.commit()
+            self.notify()
+
+    def notify(self):
+        self.start()
+        self.wakeup.set()
+
+    def start(self):
+        # Each gunicorn worker starts its own drain thread after forking (post_worker_init), and
+        # enqueue starts it again if it is not running
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name='outbox', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(timeout=self.app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 5))
+            self.wakeup.clear()
+
+            with self.app.app_context():
+                try:
+                    while self.drain():
+                        pass
+                except Exception:
+                    self.app.logger.exception('Draining the email outbox failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def claim(self, batch_size):
+
+        # Leased by pushing next_attempt_at past the time a batch can take to send, so the rows
+        # are not locked while Mailgun is called and come back if this worker dies mid-batch
+        lease = timedelta(seconds=self.app.config.get('MAIL_OUTBOX_LEASE', 30 * 60))
+
+        emails = OutboxEmail.get_due(limit=batch_size)
+
+        claimed = []
+
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = datetime.utcnow() + lease
+
+            claimed.append({'id': email.id, 'recipient': email.recipient, 'subject': email.subject,
+                            'text': email.text, 'html': email.html, 'attempts': email.attempts,
+                            'variables': json.loads(email.variables) if email.variables else {}})
+
+        db.session.commit()
+
+        return claimed
+
+    def drain(self):
+
+        batch_size = self.app.config.get('MAIL_OUTBOX_BATCH_SIZE', 100)
+
+        emails = self.claim(batch_size)
+
+        if not emails:
+            return False
+
+        batches = {}
+
+        for email in emails:
+            key = (email['subject'], email['text'], email['html'])
+            groups = batches.setdefault(key, [[]])
+
+            # Recipient variables are keyed by address, so an address appears once per batch
+            if any(other['recipient'] == email['recipient'] for other in groups[-1]):
+                groups.append([])
+
+            groups[-1].append(email)
+
+        for (subject, text, html), groups in batches.items():
+            for batch in groups:
+
+                error = None
+
+                try:
+                    response = self.mailgun.send_email(to=[email['recipient'] for email in batch],
+                                                       subject=subject, text=text, html=html,
+                                                       recipient_variables={email['recipient']: email['variables']
+                                                                            for email in batch})
+                    if response.status_code >= 400:
+                        error = 'HTTP {}: {}'.format(response.status_code, response.text)
+                except Exception as e:
+                    error = str(e)
+
+                for email in batch:
+                    self.record(email, error)
+
+                db.session.commit()
+
+        return len(emails) == batch_size
+
+    def record(self, email, error):
+
+        if error is None:
+            values = {'status': 'sent', 'sent_at': datetime.utcnow()}
+        elif email['attempts'] >= self.app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8):
+            values = {'status': 'failed', 'last_error': error[:200]}
+        else:
+            backoff = self.app.config.get('MAIL_OUTBOX_RETRY_BACKOFF', 30) * 2 ** (email['attempts'] - 1)
+            values = {'last_error': error[:200], 'next_attempt_at': datetime.utcnow() + timedelta(seconds=backoff)}
+
+        OutboxEmail.query.filter_by(id=email['id']).update(values, synchronize_session=False)
+
+
+outbox = Outbox()
@@ -0,0 +1,142 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import String, and_, asc, desc, or_, type_coerce
+
+from instrumentation import instrumentation
+
+
+class CursorPage:
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, key, ascending, value, id):
+
+    if isinstance(value, datetime):
+        value = {'datetime': value.isoformat()}
+
+    data = json.dumps([direction, key, 'asc' if ascending else 'desc', value, id], separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key, ascending):
+
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        direction, cursor_key, order, value, id = json.loads(base64.urlsafe_b64decode(cursor + padding).decode())
+
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['datetime'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+
+    if direction not in ['next', 'prev'] or not isinstance(id, int):
+        raise ValueError('Invalid cursor')
+
+    # The value is compared with the sort column, so it must come from the same sort
+    if cursor_key != key or order != ('asc' if ascending else 'desc'):
+        raise ValueError('Cursor does not match the sort and order')
+
+    return direction, value, id
+
+
+def order_by(column, id_column, ascending):
+    # NULLS LAST ascending / NULLS FIRST descending is PostgreSQL's native index order
+    if ascending:
+        return asc(column).nullslast(), asc(id_column)
+
+    return desc(column).nullsfirst(), desc(id_column)
+
+
+def seek(column, id_column, value, id, ascending):
+
+    if ascending:
+        if value is None:
+            return and_(column.is_(None), id_column > id)
+        return or_(column > value, and_(column == value, id_column > id), column.is_(None))
+
+    if value is None:
+        return or_(column.isnot(None), and_(column.is_(None), id_column < id))
+    return or_(column < value, and_(column == value, id_column < id))
+
+
+def keyset_paginate(query, column, id_column, ascending, per_page, cursor):
+    key = column.key
+
+    direction, value, id = decode_cursor(cursor, key, ascending) if cursor else ('next', None, None)
+
+    forward = direction == 'next'
+
+    if id is not None:
+        seek_column = column
+
+        # SQLite keeps CURRENT_TIMESTAMP defaults as text without microseconds
+        if isinstance(value, datetime) and query.session.get_bind().dialect.name == 'sqlite':
+            seek_column = type_coerce(column, String)
+            value = value.isoformat(' ', 'microseconds' if value.microsecond else 'seconds')
+
+        query = query.filter(seek(seek_column, id_column, value, id, ascending == forward))
+
+    items = query.order_by(None).order_by(*order_by(column, id_column, ascending == forward)).limit(per_page + 1).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if not forward:
+        items.reverse()
+
+    next_cursor = None
+    prev_cursor = None
+
+    if items:
+        first, last = items[0], items[-1]
+
+        if has_more or not forward:
+            next_cursor = encode_cursor('next', key, ascending, getattr(last, key), last.id)
+
+        if (has_more and not forward) or (forward and id is not None):
+            prev_cursor = encode_cursor('prev', key, ascending, getattr(first, key), first.id)
+
+    return CursorPage(items=items, per_page=per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def get_max_per_page():
+
+    max_per_page = current_app.config['MAX_PER_PAGE']
+    target = current_app.config.get('ADAPTIVE_PER_PAGE_DB_TARGET')
+
+    if target:
+        latency = instrumentation.get_db_latency(request.endpoint)
+
+        # Shrink the pages in proportion to how far this endpoint's DB time is over the target
+        if latency is not None and latency > target:
+            max_per_page = max(current_app.config['MIN_MAX_PER_PAGE'], int(max_per_page * target / latency))
+
+    return max_per_page
+
+
+def get_page_size(per_page):
+
+    max_per_page = get_max_per_page()
+
+    return max(1, min(per_page, max_per_page)), max_per_page
+
+
+def get_page_size_headers(per_page, max_per_page):
+    return {'X-Per-Page': str(per_page), 'X-Max-Per-Page': str(max_per_page)}
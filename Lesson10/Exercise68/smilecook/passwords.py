@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.hash import pbkdf2_sha256
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def hash_in_worker(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def verify_in_worker(password, hashed):
+    return pbkdf2_sha256.verify(password, hashed)
+
+
+class PasswordHasher:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+        self.rounds = pbkdf2_sha256.default_rounds
+        self.workers = 0
+        self.max_pending = 0
+        self.slots = None
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+
+    def init_app(self, app):
+        self.rounds = app.config.get('PASSWORD_HASH_ROUNDS') or pbkdf2_sha256.default_rounds
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING') or 4 * max(self.workers, 1)
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        return self.executor
+
+    def submit(self, fn, *args):
+        executor = self.get_executor()
+
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A child died (e.g. OOM killed); start a fresh pool instead of failing every later call
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            executor.shutdown(wait=False)
+
+        return self.get_executor().submit(fn, *args).result()
+
+    def run(self, fn, *args):
+
+        if not self.workers:
+            return fn(*args)
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+
+        start = time.monotonic()
+
+        with self.lock:
+            self.pending += 1
+
+        try:
+            return self.submit(fn, *args)
+        finally:
+            self.slots.release()
+
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+                self.wait_time += time.monotonic() - start
+
+    def hash(self, password):
+        return self.run(hash_in_worker, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self.run(verify_in_worker, password, hashed)
+
+    def needs_update(self, hashed):
+        return pbkdf2_sha256.using(rounds=self.rounds).needs_update(hashed)
+
+    def get_stats(self):
+        with self.lock:
+            return {'pending': self.pending,
+                    'max_pending': self.max_pending,
+                    'completed': self.completed,
+                    'rejected': self.rejected,
+                    'wait_seconds': self.wait_time}
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+WAIT_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.wait_warning = None
+        self.logger = logging.getLogger(__name__)
+
+    def init_app(self, app):
+        self.wait_warning = app.config.get('SQLALCHEMY_POOL_WAIT_WARNING')
+        self.logger = app.logger
+
+    def observe(self, pool, elapsed, timed_out=False):
+        with self.lock:
+            stats = self.pools.setdefault(pool.logging_name, {'waits': 0, 'wait_time': 0.0, 'timeouts': 0,
+                                                              'buckets': [0] * len(WAIT_BUCKETS)})
+            stats['pool'] = pool
+            stats['waits'] += 1
+            stats['wait_time'] += elapsed
+            stats['timeouts'] += timed_out
+
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if elapsed <= bound:
+                    stats['buckets'][i] += 1
+
+        if timed_out or (self.wait_warning is not None and elapsed > self.wait_warning):
+            self.logger.warning('Waited %.1f ms for a connection from %s (%d checked out, %d overflow)%s',
+                                elapsed * 1000, pool.logging_name, pool.checkedout(), max(0, pool.overflow()),
+                                ', timed out' if timed_out else '')
+
+    def collect(self):
+        with self.lock:
+            pools = sorted((name, dict(stats, buckets=list(stats['buckets']))) for name, stats in self.pools.items())
+
+        wait_samples = []
+        for name, stats in pools:
+            for bound, count in zip(WAIT_BUCKETS, stats['buckets']):
+                wait_samples.append(({'pool': name, 'le': bound}, count, '_bucket'))
+            wait_samples.append(({'pool': name, 'le': '+Inf'}, stats['waits'], '_bucket'))
+            wait_samples.append(({'pool': name}, round(stats['wait_time'], 6), '_sum'))
+            wait_samples.append(({'pool': name}, stats['waits'], '_count'))
+
+        return [('smilecook_db_pool_size', 'gauge', 'Connections kept open by the pool.',
+                 [({'pool': name}, stats['pool'].size()) for name, stats in pools]),
+                ('smilecook_db_pool_checked_out', 'gauge', 'Connections currently checked out.',
+                 [({'pool': name}, stats['pool'].checkedout()) for name, stats in pools]),
+                ('smilecook_db_pool_overflow', 'gauge', 'Connections open beyond the pool size.',
+                 [({'pool': name}, max(0, stats['pool'].overflow())) for name, stats in pools]),
+                ('smilecook_db_pool_timeouts_total', 'counter', 'Checkouts that gave up after pool_timeout.',
+                 [({'pool': name}, stats['timeouts']) for name, stats in pools]),
+                ('smilecook_db_pool_wait_seconds', 'histogram', 'Time spent waiting for a connection.', wait_samples)]
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def _do_get(self):
+        start = time.perf_counter()
+
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except TimeoutError:
+            pool_metrics.observe(self, time.perf_counter() - start, timed_out=True)
+            raise
+
+        pool_metrics.observe(self, time.perf_counter() - start)
+
+        return connection
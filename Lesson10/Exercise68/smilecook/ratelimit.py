@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request_optional
+from flask_limiter.util import get_remote_address
+from limits.storage import Storage, storage_from_string
+
+
+def get_rate_limit_key():
+
+    try:
+        verify_jwt_in_request_optional()
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+
+    if identity is not None:
+        return 'user:{}'.format(identity)
+
+    return get_remote_address()
+
+
+# Fixed-window counters in a SQLite file shared by every worker on the host,
+# e.g. file:///var/run/smilecook/ratelimit.db
+class FileStorage(Storage):
+
+    STORAGE_SCHEME = 'file'
+
+    def __init__(self, uri=None, **options):
+        self.path = urlparse(uri).path if uri else ''
+        self.path = self.path or os.path.join(tempfile.gettempdir(), 'smilecook-ratelimit.db')
+        self.local = threading.local()
+        self.writes = 0
+
+        self.connection().execute('PRAGMA journal_mode=WAL')
+        self.connection().execute('CREATE TABLE IF NOT EXISTS ratelimit '
+                                  '(key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)')
+
+        super(FileStorage, self).__init__(uri)
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+        return connection
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        connection = self.connection()
+        now = time.time()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT INTO ratelimit (key, count, expires_at) VALUES (?, ?, ?) '
+                               'ON CONFLICT(key) DO UPDATE SET '
+                               'count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, '
+                               'expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END',
+                               (key, amount, now + expiry, now, now, bool(elastic_expiry)))
+            count, = connection.execute('SELECT count FROM ratelimit WHERE key = ?', (key, )).fetchone()
+
+            self.writes += 1
+            if self.writes % 1000 == 0:
+                connection.execute('DELETE FROM ratelimit WHERE expires_at <= ?', (now, ))
+
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        return count
+
+    def get(self, key):
+        row = self.connection().execute('SELECT count FROM ratelimit WHERE key = ? AND expires_at > ?',
+                                        (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self.connection().execute('SELECT expires_at FROM ratelimit WHERE key = ? AND expires_at > ?',
+                                        (key, time.time())).fetchone()
+        return int(row[0]) if row else int(time.time())
+
+    def check(self):
+        try:
+            self.connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        self.connection().execute('DELETE FROM ratelimit')
+
+    def clear(self, key):
+        self.connection().execute('DELETE FROM ratelimit WHERE key = ?', (key, ))
+
+
+# Wraps a shared storage (buffered+file://..., buffered+redis://...). While a key is
+# well below its limit each worker may count up to local_share of the remaining
+# allowance in memory for sync_interval seconds, then writes the hits in one go.
+class BufferedStorage(Storage):
+
+    STORAGE_SCHEME = 'buffered+file'
+
+    def __init__(self, uri=None, sync_interval=1, local_share=0.1, **options):
+        self.storage = storage_from_string(uri.split('+', 1)[1], **options)
+        self.sync_interval = sync_interval
+        self.local_share = local_share
+        self.entries = {}
+
+        super(BufferedStorage, self).__init__(uri)
+
+    def flush(self, key, expiry, elastic_expiry, amount):
+
+        if isinstance(self.storage, FileStorage):
+            return self.storage.incr(key, expiry, elastic_expiry, amount=amount)
+
+        client = getattr(self.storage, 'storage', None)
+
+        if hasattr(client, 'incrby'):
+            count = client.incrby(key, amount)
+            if count == amount or elastic_expiry:
+                client.expire(key, expiry)
+            return count
+
+        for _ in range(amount - 1):
+            self.storage.incr(key, expiry, elastic_expiry)
+
+        return self.storage.incr(key, expiry, elastic_expiry)
+
+    def incr(self, key, expiry, elastic_expiry=False):
+        # limits keys end with <amount>/<multiples>/<granularity>
+        limit = int(key.split('/')[-3])
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry['expires_at'] <= now:
+                entry = None
+
+            if entry is not None and now - entry['synced_at'] < self.sync_interval \
+                    and entry['pending'] + 1 <= (limit - entry['count']) * self.local_share:
+                entry['pending'] += 1
+                return entry['count'] + entry['pending']
+
+            pending = entry['pending'] if entry is not None else 0
+            expires_at = entry['expires_at'] if entry is not None else now + expiry
+
+            self.entries[key] = {'count': entry['count'] + pending if entry else 0, 'pending': 0,
+                                 'synced_at': now, 'expires_at': expires_at}
+
+        count = self.flush(key, expiry, elastic_expiry, pending + 1)
+
+        with self.lock:
+            self.entries[key]['count'] = count
+
+        return count
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            pending = entry['pending'] if entry is not None and entry['expires_at'] > time.time() else 0
+
+        return self.storage.get(key) + pending
+
+    def get_expiry(self, key):
+        return self.storage.get_expiry(key)
+
+    def check(self):
+        return self.storage.check()
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+        return self.storage.reset()
+
+    def clear(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+        return self.storage.clear(key)
+
+
+class BufferedRedisStorage(BufferedStorage):
+
+    STORAGE_SCHEME = 'buffered+redis'
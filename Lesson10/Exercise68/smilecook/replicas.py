@@ -0,0 +1,161 @@
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import decode_token
+from flask_limiter.util import get_remote_address
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from extensions import cache, db
+
+READ_METHODS = ['GET', 'HEAD']
+
+
+# Sends the SELECTs of GET requests to the read replicas in SQLALCHEMY_REPLICA_URIS.
+# Clients that wrote recently read from the primary for REPLICA_READ_AFTER_WRITE_WINDOW
+# seconds, and a replica that fails is skipped for REPLICA_RETRY_INTERVAL seconds.
+# Failures are noticed by the queries themselves (handle_error) and by a ping sent
+# at most every REPLICA_HEALTH_CHECK_INTERVAL seconds per replica, not on every request.
+class ReplicaRouter:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.binds = []
+        self.engines = {}
+        self.ejected = {}
+        self.checked_at = {}
+        self.counter = itertools.count()
+
+        self.read_after_write_window = 5
+        self.retry_interval = 30
+        self.health_check_interval = 10
+
+    def init_app(self, app):
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+
+        self.read_after_write_window = app.config.get('REPLICA_READ_AFTER_WRITE_WINDOW', self.read_after_write_window)
+        self.retry_interval = app.config.get('REPLICA_RETRY_INTERVAL', self.retry_interval)
+        self.health_check_interval = app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', self.health_check_interval)
+
+        if not uris:
+            return
+
+        binds = app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+
+        for i, uri in enumerate(uris):
+            bind = 'replica_{}'.format(i)
+            binds[bind] = uri
+            self.binds.append(bind)
+
+        if not event.contains(Engine, 'handle_error', self.handle_error):
+            event.listen(Engine, 'handle_error', self.handle_error)
+
+        app.after_request(self.after_request)
+        app.extensions['replica_router'] = self
+
+    def get_client_key(self):
+
+        # Decoded without the revocation check, which would itself query the database from get_bind
+        identity = None
+        authorization = request.headers.get('Authorization', '')
+
+        if authorization.startswith('Bearer '):
+            try:
+                identity = decode_token(authorization[len('Bearer '):])[current_app.config['JWT_IDENTITY_CLAIM']]
+            except Exception:
+                identity = None
+
+        if identity is not None:
+            return 'primary/user:{}'.format(identity)
+
+        return 'primary/{}'.format(get_remote_address())
+
+    def after_request(self, response):
+
+        if request.method not in READ_METHODS and response.status_code < 400:
+            cache.set(self.get_client_key(), True, timeout=self.read_after_write_window)
+
+        return response
+
+    def reads_from_replica(self):
+
+        if not has_request_context() or request.method not in READ_METHODS:
+            return False
+
+        if 'read_from_replica' not in g:
+            g.read_from_replica = not cache.get(self.get_client_key())
+
+        return g.read_from_replica
+
+    def get_read_engine(self):
+
+        if not self.binds or not self.reads_from_replica():
+            return None
+
+        if 'replica_engine' in g:
+            return g.replica_engine
+
+        now = time.monotonic()
+        start = next(self.counter)
+
+        for i in range(len(self.binds)):
+            bind = self.binds[(start + i) % len(self.binds)]
+
+            with self.lock:
+                retry_at = self.ejected.get(bind)
+
+                if retry_at is not None and retry_at > now:
+                    continue
+
+                due = now - self.checked_at.get(bind, float('-inf')) >= self.health_check_interval
+                if due:
+                    self.checked_at[bind] = now
+
+            engine = db.get_engine(current_app, bind=bind)
+            self.engines[engine] = bind
+
+            # Also the way back for an ejected replica once its retry interval is over
+            if due or retry_at is not None:
+                if not self.ping(engine):
+                    self.eject(bind)
+                    continue
+
+                with self.lock:
+                    self.ejected.pop(bind, None)
+
+            # One replica per request so that its reads are consistent with each other
+            g.replica_engine = engine
+            return engine
+
+        g.replica_engine = None
+        return None
+
+    def ping(self, engine):
+        try:
+            engine.connect().close()
+            return True
+        except OperationalError:
+            return False
+
+    def eject(self, bind):
+        with self.lock:
+            self.ejected[bind] = time.monotonic() + self.retry_interval
+
+    def handle_error(self, context):
+        bind = self.engines.get(context.engine)
+
+        if bind is not None and (context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError)):
+            current_app.logger.warning('Ejecting read replica %s: %s', bind, context.original_exception)
+            self.eject(bind)
+
+    def get_stats(self):
+        now = time.monotonic()
+
+        with self.lock:
+            return {bind: self.ejected.get(bind, 0) <= now for bind in self.binds}
+
+
+replica_router = ReplicaRouter()
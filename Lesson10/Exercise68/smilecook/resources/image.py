@@ -0,0 +1,52 @@
+import os
+
+from flask import current_app
+from flask_restful import Resource
+from http import HTTPStatus
+from werkzeug.utils import secure_filename
+
+from extensions import image_set
+from image_queue import get_job
+from static_files import static_files
+
+from utils import IMAGE_FORMATS, get_image_variant_path, generate_image_variant
+
+IMAGE_FOLDERS = ['recipes', 'avatars', 'assets']
+
+
+class ImageVariantResource(Resource):
+
+    def get(self, folder, variant, filename):
+
+        stem, _, image_format = filename.rpartition('.')
+
+        sizes = current_app.config['IMAGE_VARIANTS']
+
+        if folder not in IMAGE_FOLDERS or variant not in sizes or image_format not in IMAGE_FORMATS \
+                or not stem or secure_filename(filename) != filename:
+            return {'message': 'Image not found'}, HTTPStatus.NOT_FOUND
+
+        variant_path = get_image_variant_path(folder, stem, variant, image_format)
+
+        if not os.path.exists(variant_path):
+
+            source_path = image_set.path(filename='{}.jpg'.format(stem), folder=folder)
+
+            if not os.path.exists(source_path):
+                return {'message': 'Image not found'}, HTTPStatus.NOT_FOUND
+
+            generate_image_variant(source_path, variant_path, sizes[variant], image_format)
+
+        return static_files.send(variant_path, mimetype='image/{}'.format(IMAGE_FORMATS[image_format].lower()))
+
+
+class ImageJobResource(Resource):
+
+    def get(self, job_id):
+
+        job = get_job(job_id)
+
+        if job is None:
+            return {'message': 'Job not found'}, HTTPStatus.NOT_FOUND
+
+        return job, HTTPStatus.OK
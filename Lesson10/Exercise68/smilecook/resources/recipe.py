@@ -1,6 +1,10 @@
+import csv
+import functools
+import io
+import json
 import os
 
-from flask import request
+from flask import Response, current_app, request, stream_with_context, url_for
 from flask_restful import Resource
 from flask_jwt_extended import get_jwt_identity, jwt_required, jwt_optional
 from http import HTTPStatus
@@ -11,9 +15,15 @@ from webargs.flaskparser import use_kwargs
 from models.recipe import Recipe
 from schemas.recipe import RecipeSchema, RecipePaginationSchema
 
-from extensions import image_set, cache, limiter
+from caching import cached, invalidate, recipe_list_tags
+from conditional import get_validator_headers, has_validators, is_modified, make_etag, not_modified
+from extensions import image_set, limiter
+from image_queue import image_queue
+from instrumentation import instrumentation
+from pagination import get_page_size, get_page_size_headers
+from serializers import dump
 
-from utils import save_image, clear_cache
+from utils import remove_image_variants
 
 recipe_schema = RecipeSchema()
 recipe_cover_schema = RecipeSchema(only=('cover_url', ))
@@ -28,21 +38,28 @@ class RecipeListResource(Resource):
                  'page': fields.Int(missing=1),
                  'per_page': fields.Int(missing=20),
                  'sort': fields.Str(missing='created_at'),
-                 'order': fields.Str(missing='desc')})
-    @cache.cached(timeout=60, query_string=True)
-    def get(self, q, page, per_page, sort, order):
+                 'order': fields.Str(missing='desc'),
+                 'cursor': fields.Str(missing=None)})
+    @cached(timeout=60, tags=['recipe_list'], dynamic_tags=recipe_list_tags)
+    def get(self, q, page, per_page, sort, order, cursor):
 
-        print('Querying database...')
-
-        if sort not in ['created_at', 'cook_time', 'num_of_servings']:
+        if sort not in ['created_at', 'cook_time', 'num_of_servings', 'relevance']:
             sort = 'created_at'
 
         if order not in ['asc', 'desc']:
             order = 'desc'
 
-        paginated_recipes = Recipe.get_all_published(q, page, per_page, sort, order)
+        per_page, max_per_page = get_page_size(per_page)
+
+        try:
+            paginated_recipes = Recipe.get_all_published(q, page, per_page, sort, order, cursor)
+        except ValueError:
+            return {'message': 'Invalid cursor'}, HTTPStatus.BAD_REQUEST
+
+        with instrumentation.timer('serialize'):
+            data = dump(recipe_pagination_schema, paginated_recipes)
 
-        return recipe_pagination_schema.dump(paginated_recipes).data, HTTPStatus.OK
+        return data, HTTPStatus.OK, get_page_size_headers(per_page, max_per_page)
 
     @jwt_required
     def post(self):
@@ -63,22 +80,184 @@ class RecipeListResource(Resource):
         return recipe_schema.dump(recipe).data, HTTPStatus.CREATED
 
 
+class RecipeBulkResource(Resource):
+
+    @jwt_required
+    def post(self):
+
+        json_data = request.get_json() or {}
+
+        if not isinstance(json_data, dict):
+            return {'message': 'Validation errors', 'errors': {'_schema': ['Invalid input type.']}}, HTTPStatus.BAD_REQUEST
+
+        items = {kind: json_data.get(kind, []) for kind in ['create', 'update', 'publish', 'unpublish']}
+
+        errors = {kind: 'Must be a list.' for kind, value in items.items() if not isinstance(value, list)}
+        errors.update({kind: {i: ['Invalid input type.'] for i, item in enumerate(items[kind]) if not isinstance(item, dict)}
+                       for kind in ['create', 'update'] if kind not in errors})
+        errors = {kind: error for kind, error in errors.items() if error}
+
+        if errors:
+            return {'message': 'Validation errors', 'errors': errors}, HTTPStatus.BAD_REQUEST
+
+        max_items = current_app.config['RECIPE_BULK_MAX_ITEMS']
+
+        if sum(len(value) for value in items.values()) > max_items:
+            return {'message': 'At most {} items per request'.format(max_items)}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+        current_user = get_jwt_identity()
+
+        create_data, create_errors = recipe_list_schema.load(items['create'])
+        update_data, update_errors = recipe_list_schema.load(items['update'], partial=True)
+
+        def is_id(value):
+            return isinstance(value, int) and not isinstance(value, bool)
+
+        update_ids = [item.get('id') for item in items['update']]
+        owners = Recipe.get_owners([recipe_id for recipe_id in update_ids + items['publish'] + items['unpublish']
+                                    if is_id(recipe_id)])
+
+        def check_owner(recipe_id):
+            if not is_id(recipe_id):
+                return {'status': HTTPStatus.BAD_REQUEST, 'errors': {'id': ['Not a valid integer.']}}
+
+            if recipe_id not in owners:
+                return {'status': HTTPStatus.NOT_FOUND, 'message': 'Recipe not found'}
+
+            if owners[recipe_id] != current_user:
+                return {'status': HTTPStatus.FORBIDDEN, 'message': 'Access is not allowed'}
+
+        results = {kind: [] for kind in items}
+        creates, updates, publish_ids, unpublish_ids = [], [], [], []
+
+        # Index in items['create'] -> mapping in creates
+        created_mappings = {}
+
+        for i, data in enumerate(create_data):
+            if i in create_errors:
+                results['create'].append({'status': HTTPStatus.BAD_REQUEST, 'errors': create_errors[i]})
+            else:
+                created_mappings[i] = dict(data, user_id=current_user)
+                creates.append(created_mappings[i])
+                results['create'].append({'status': HTTPStatus.CREATED})
+
+        for i, (recipe_id, data) in enumerate(zip(update_ids, update_data)):
+            error = check_owner(recipe_id)
+
+            if i in update_errors:
+                results['update'].append({'status': HTTPStatus.BAD_REQUEST, 'errors': update_errors[i]})
+            elif error is not None:
+                results['update'].append(error)
+            else:
+                # Same semantics as RecipeResource.patch: empty values keep the current ones
+                updates.append(dict({key: value for key, value in data.items() if value}, id=recipe_id))
+                results['update'].append({'status': HTTPStatus.OK, 'id': recipe_id})
+
+        # Recipes created in the same request are referred to as {"create": <index in create>}
+        published_creates = []
+
+        for kind, ids in [('publish', publish_ids), ('unpublish', unpublish_ids)]:
+            for recipe_id in items[kind]:
+                if isinstance(recipe_id, dict) and list(recipe_id) == ['create']:
+                    index = recipe_id['create']
+
+                    if not is_id(index) or index not in created_mappings:
+                        results[kind].append({'status': HTTPStatus.BAD_REQUEST,
+                                              'errors': {'create': ['Not a created item.']}})
+                    else:
+                        created_mappings[index]['is_publish'] = kind == 'publish'
+                        result = {'status': HTTPStatus.NO_CONTENT}
+                        published_creates.append((result, created_mappings[index]))
+                        results[kind].append(result)
+                    continue
+
+                error = check_owner(recipe_id)
+
+                if error is not None:
+                    results[kind].append(error)
+                else:
+                    ids.append(recipe_id)
+                    results[kind].append({'status': HTTPStatus.NO_CONTENT, 'id': recipe_id})
+
+        created_ids = Recipe.bulk_write(creates, updates, publish_ids, unpublish_ids)
+
+        created = iter(created_ids)
+        for result in results['create']:
+            if result['status'] == HTTPStatus.CREATED:
+                result['id'] = next(created)
+
+        for result, mapping in published_creates:
+            result['id'] = mapping['id']
+
+        changed_ids = set(created_ids + [mapping['id'] for mapping in updates] + publish_ids + unpublish_ids)
+
+        if changed_ids:
+            invalidate('recipe_list', *['recipe:{}'.format(recipe_id) for recipe_id in changed_ids])
+
+        return {'results': results}, HTTPStatus.OK
+
+
+class RecipeExportResource(Resource):
+    decorators = [limiter.limit('10 per hour', methods=['GET'], error_message='Too Many Requests')]
+
+    @jwt_optional
+    @use_kwargs({'format': fields.Str(missing='ndjson'),
+                 'scope': fields.Str(missing='published')})
+    def get(self, format, scope):
+
+        if format not in ['ndjson', 'csv']:
+            return {'message': 'Format must be ndjson or csv'}, HTTPStatus.BAD_REQUEST
+
+        current_user = get_jwt_identity()
+
+        if scope == 'mine' and current_user is None:
+            return {'message': 'Missing Authorization Header'}, HTTPStatus.UNAUTHORIZED
+
+        recipes = Recipe.get_all_for_export(user_id=current_user if scope == 'mine' else None,
+                                            batch_size=current_app.config['RECIPE_EXPORT_BATCH_SIZE'])
+
+        if format == 'csv':
+            mimetype = 'text/csv'
+            chunks = export_csv(recipes, current_app.config['RECIPE_EXPORT_BATCH_SIZE'])
+        else:
+            mimetype = 'application/x-ndjson'
+            chunks = export_ndjson(recipes, current_app.config['RECIPE_EXPORT_BATCH_SIZE'])
+
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': 'attachment; filename=recipes.{}'.format(format)})
+
+
 class RecipeResource(Resource):
 
     @jwt_optional
     def get(self, recipe_id):
 
+        current_user = get_jwt_identity()
+
+        if has_validators():
+            version = Recipe.get_version(recipe_id=recipe_id)
+
+            if version is not None and (version.is_publish or version.user_id == current_user):
+                etag, last_modified = get_recipe_validators(recipe_id, version.updated_at, version.user_updated_at)
+
+                if not is_modified(etag, last_modified):
+                    return not_modified(etag, last_modified)
+
         recipe = Recipe.get_by_id(recipe_id=recipe_id)
 
         if recipe is None:
             return {'message': 'Recipe not found'}, HTTPStatus.NOT_FOUND
 
-        current_user = get_jwt_identity()
-
         if recipe.is_publish == False and recipe.user_id != current_user:
             return {'message': 'Access is not allowed'}, HTTPStatus.FORBIDDEN
 
-        return recipe_schema.dump(recipe).data, HTTPStatus.OK
+        etag, last_modified = get_recipe_validators(recipe.id, recipe.updated_at,
+                                                    recipe.user.updated_at if recipe.user else None)
+
+        with instrumentation.timer('serialize'):
+            data = dump(recipe_schema, recipe)
+
+        return data, HTTPStatus.OK, get_validator_headers(etag, last_modified)
 
     @jwt_required
     def patch(self, recipe_id):
@@ -109,7 +288,7 @@ class RecipeResource(Resource):
 
         recipe.save()
 
-        clear_cache('/recipes')
+        invalidate('recipe_list', 'recipe:{}'.format(recipe_id))
 
         return recipe_schema.dump(recipe).data, HTTPStatus.OK
 
@@ -128,7 +307,7 @@ class RecipeResource(Resource):
 
         recipe.delete()
 
-        clear_cache('/recipes')
+        invalidate('recipe_list', 'recipe:{}'.format(recipe_id))
 
         return {}, HTTPStatus.NO_CONTENT
 
@@ -151,7 +330,7 @@ class RecipePublishResource(Resource):
         recipe.is_publish = True
         recipe.save()
 
-        clear_cache('/recipes')
+        invalidate('recipe_list', 'recipe:{}'.format(recipe_id))
 
         return {}, HTTPStatus.NO_CONTENT
 
@@ -171,7 +350,7 @@ class RecipePublishResource(Resource):
         recipe.is_publish = False
         recipe.save()
 
-        clear_cache('/recipes')
+        invalidate('recipe_list', 'recipe:{}'.format(recipe_id))
 
         return {}, HTTPStatus.NO_CONTENT
 
@@ -199,16 +378,80 @@ class RecipeCoverUploadResource(Resource):
         if current_user != recipe.user_id:
             return {'message': 'Access is not allowed'}, HTTPStatus.FORBIDDEN
 
-        if recipe.cover_image:
-            cover_path = image_set.path(folder='recipes', filename=recipe.cover_image)
-            if os.path.exists(cover_path):
-                os.remove(cover_path)
+        job_id = image_queue.submit(image=file, folder='recipes',
+                                    on_complete=functools.partial(set_recipe_cover, recipe_id=recipe.id))
 
-        filename = save_image(image=file, folder='recipes')
+        if job_id is not None:
+            data = recipe_cover_schema.dump(recipe).data
+            data['status'] = 'pending'
+            data['job_url'] = url_for('imagejobresource', job_id=job_id, _external=True)
+            return data, HTTPStatus.ACCEPTED
 
-        recipe.cover_image = filename
-        recipe.save()
-
-        clear_cache('/recipes')
+        recipe = Recipe.get_by_id(recipe_id=recipe_id)
 
         return recipe_cover_schema.dump(recipe).data, HTTPStatus.OK
+
+
+def export_ndjson(recipes, batch_size):
+
+    lines = []
+
+    for recipe in recipes:
+        lines.append(json.dumps(dump(recipe_schema, recipe)))
+
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_csv(recipes, batch_size):
+
+    columns = ['id', 'name', 'description', 'num_of_servings', 'cook_time', 'ingredients', 'directions',
+               'is_publish', 'cover_url', 'author', 'created_at', 'updated_at']
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for i, recipe in enumerate(recipes, 1):
+        data = dump(recipe_schema, recipe)
+        data['author'] = data['author']['username'] if data.get('author') else None
+        writer.writerow([data.get(column) for column in columns])
+
+        if i % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def get_recipe_validators(recipe_id, updated_at, user_updated_at):
+
+    # The author is nested in the representation, so their changes (e.g. a new avatar) count too
+    last_modified = max(updated_at, user_updated_at) if user_updated_at else updated_at
+
+    return make_etag('recipe', recipe_id, updated_at, user_updated_at), last_modified
+
+
+def set_recipe_cover(filename, recipe_id):
+
+    recipe = Recipe.get_by_id(recipe_id=recipe_id)
+
+    if recipe is None:
+        os.remove(image_set.path(folder='recipes', filename=filename))
+        return
+
+    if recipe.cover_image:
+        cover_path = image_set.path(folder='recipes', filename=recipe.cover_image)
+        if os.path.exists(cover_path):
+            os.remove(cover_path)
+        remove_image_variants(folder='recipes', filename=recipe.cover_image)
+
+    recipe.cover_image = filename
+    recipe.save()
+
+    invalidate('recipe:{}'.format(recipe.id))
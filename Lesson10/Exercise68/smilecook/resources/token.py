@@ -10,10 +10,10 @@ from flask_jwt_extended import (
     get_raw_jwt
 )
 
-from utils import check_password
+from utils import check_password, hash_password
 from models.user import User
-
-black_list = set()
+from passwords import password_hasher, PasswordHasherBusy
+from revocation import revocation_store
 
 
 class TokenResource(Resource):
@@ -27,11 +27,18 @@ class TokenResource(Resource):
 
         user = User.get_by_email(email=email)
 
-        if not user or not check_password(password, user.password):
-            return {'message': 'username or password is incorrect'}, HTTPStatus.UNAUTHORIZED
+        try:
+            if not user or not check_password(password, user.password):
+                return {'message': 'username or password is incorrect'}, HTTPStatus.UNAUTHORIZED
+
+            if user.is_active is False:
+                return {'message': 'The user account is not activated yet'}, HTTPStatus.FORBIDDEN
 
-        if user.is_active is False:
-            return {'message': 'The user account is not activated yet'}, HTTPStatus.FORBIDDEN
+            if password_hasher.needs_update(user.password):
+                user.password = hash_password(password)
+                user.save()
+        except PasswordHasherBusy:
+            return {'message': 'Too Many Requests'}, HTTPStatus.TOO_MANY_REQUESTS
 
         access_token = create_access_token(identity=user.id, fresh=True)
         refresh_token = create_refresh_token(identity=user.id)
@@ -54,8 +61,8 @@ class RevokeResource(Resource):
 
     @jwt_required
     def post(self):
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
 
-        black_list.add(jti)
+        revocation_store.revoke(raw_jwt['jti'], raw_jwt['exp'])
 
         return {'message': 'Successfully logged out'}, HTTPStatus.OK
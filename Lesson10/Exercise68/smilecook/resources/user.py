@@ -1,3 +1,4 @@
+import functools
 import os
 
 from flask import request, url_for, render_template
@@ -8,15 +9,22 @@ from http import HTTPStatus
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from extensions import image_set, limiter
-from mailgun import MailgunApi
+from extensions import db, image_set, limiter
 from models.recipe import Recipe
 from models.user import User
+from passwords import PasswordHasherBusy
 
 from schemas.user import UserSchema
 from schemas.recipe import RecipeSchema, RecipePaginationSchema
 
-from utils import generate_token, verify_token, save_image, clear_cache
+from caching import invalidate
+from conditional import get_validator_headers, has_validators, is_modified, make_etag, not_modified
+from image_queue import image_queue
+from instrumentation import instrumentation
+from outbox import outbox
+from pagination import get_page_size, get_page_size_headers
+from serializers import dump
+from utils import generate_token, verify_token, remove_image_variants
 
 
 user_schema = UserSchema()
@@ -26,16 +34,15 @@ recipe_list_schema = RecipeSchema(many=True)
 recipe_pagination_schema = RecipePaginationSchema()
 
 
-mailgun = MailgunApi(domain=os.environ.get('MAILGUN_DOMAIN'),
-                     api_key=os.environ.get('MAILGUN_API_KEY'))
-
-
 class UserListResource(Resource):
     def post(self):
 
         json_data = request.get_json()
 
-        data, errors = user_schema.load(data=json_data)
+        try:
+            data, errors = user_schema.load(data=json_data)
+        except PasswordHasherBusy:
+            return {'message': 'Too Many Requests'}, HTTPStatus.TOO_MANY_REQUESTS
 
         if errors:
             return {'message': 'Validation errors', 'errors': errors}, HTTPStatus.BAD_REQUEST
@@ -47,7 +54,7 @@ class UserListResource(Resource):
             return {'message': 'email already used'}, HTTPStatus.BAD_REQUEST
 
         user = User(**data)
-        user.save()
+        db.session.add(user)
 
         token = generate_token(user.email, salt='activate')
 
@@ -57,12 +64,20 @@ class UserListResource(Resource):
                        token=token,
                        _external=True)
 
-        text = 'Hi, Thanks for using SmileCook! Please confirm your registration by clicking on the link: {}'.format(link)
+        # The link is filled in per recipient, so confirmations are sent in batches
+        text = 'Hi, Thanks for using SmileCook! Please confirm your registration by clicking on the link: %recipient.link%'
 
-        mailgun.send_email(to=user.email,
-                           subject=subject,
-                           text=text,
-                           html=render_template('email/confirmation.html', link=link))
+        outbox.enqueue(to=user.email,
+                       subject=subject,
+                       text=text,
+                       html=render_template('email/confirmation.html', link='%recipient.link%'),
+                       variables={user.email: {'link': link}},
+                       commit=False)
+
+        # The user and its confirmation email are committed together, so neither exists without the other
+        db.session.commit()
+
+        outbox.notify()
 
         return user_schema.dump(user).data, HTTPStatus.CREATED
 
@@ -72,19 +87,32 @@ class UserResource(Resource):
     @jwt_optional
     def get(self, username):
 
+        current_user = get_jwt_identity()
+
+        if has_validators():
+            version = User.get_version(username=username)
+
+            if version is not None:
+                etag = make_etag('user', version.id, version.updated_at, current_user == version.id)
+
+                if not is_modified(etag, version.updated_at):
+                    return not_modified(etag, version.updated_at)
+
         user = User.get_by_username(username=username)
 
         if user is None:
             return {'message': 'User not found'}, HTTPStatus.NOT_FOUND
 
-        current_user = get_jwt_identity()
+        # The owner also sees their email, so the two representations get different etags
+        etag = make_etag('user', user.id, user.updated_at, current_user == user.id)
 
-        if current_user == user.id:
-            data = user_schema.dump(user).data
-        else:
-            data = user_public_schema.dump(user).data
+        with instrumentation.timer('serialize'):
+            if current_user == user.id:
+                data = dump(user_schema, user)
+            else:
+                data = dump(user_public_schema, user)
 
-        return data, HTTPStatus.OK
+        return data, HTTPStatus.OK, get_validator_headers(etag, user.updated_at)
 
 
 class MeResource(Resource):
@@ -102,8 +130,9 @@ class UserRecipeListResource(Resource):
     @jwt_optional
     @use_kwargs({'page': fields.Int(missing=1),
                  'per_page': fields.Int(missing=10),
-                 'visibility': fields.Str(missing='public')})
-    def get(self, username, page, per_page, visibility):
+                 'visibility': fields.Str(missing='public'),
+                 'cursor': fields.Str(missing=None)})
+    def get(self, username, page, per_page, visibility, cursor):
 
         user = User.get_by_username(username=username)
 
@@ -117,9 +146,23 @@ class UserRecipeListResource(Resource):
         else:
             visibility = 'public'
 
-        paginated_recipes = Recipe.get_all_by_user(user_id=user.id, page=page, per_page=per_page, visibility=visibility)
+        per_page, max_per_page = get_page_size(per_page)
 
-        return recipe_pagination_schema.dump(paginated_recipes).data, HTTPStatus.OK
+        try:
+            paginated_recipes = Recipe.get_all_by_user(user_id=user.id, page=page, per_page=per_page,
+                                                       visibility=visibility, cursor=cursor)
+        except ValueError:
+            return {'message': 'Invalid cursor'}, HTTPStatus.BAD_REQUEST
+
+        with instrumentation.timer('serialize'):
+            data = dump(recipe_pagination_schema, paginated_recipes)
+
+        etag = make_etag(data)
+
+        if not is_modified(etag):
+            return not_modified(etag)
+
+        return data, HTTPStatus.OK, dict(get_page_size_headers(per_page, max_per_page), **get_validator_headers(etag))
 
 
 class UserActivateResource(Resource):
@@ -161,16 +204,31 @@ class UserAvatarUploadResource(Resource):
 
         user = User.get_by_id(id=get_jwt_identity())
 
-        if user.avatar_image:
-            avatar_path = image_set.path(folder='avatars', filename=user.avatar_image)
-            if os.path.exists(avatar_path):
-                os.remove(avatar_path)
-
-        filename = save_image(image=file, folder='avatars')
+        job_id = image_queue.submit(image=file, folder='avatars',
+                                    on_complete=functools.partial(set_user_avatar, user_id=user.id))
 
-        user.avatar_image = filename
-        user.save()
+        if job_id is not None:
+            data = user_avatar_schema.dump(user).data
+            data['status'] = 'pending'
+            data['job_url'] = url_for('imagejobresource', job_id=job_id, _external=True)
+            return data, HTTPStatus.ACCEPTED
 
-        clear_cache('/recipes')
+        user = User.get_by_id(id=user.id)
 
         return user_avatar_schema.dump(user).data, HTTPStatus.OK
+
+
+def set_user_avatar(filename, user_id):
+
+    user = User.get_by_id(id=user_id)
+
+    if user.avatar_image:
+        avatar_path = image_set.path(folder='avatars', filename=user.avatar_image)
+        if os.path.exists(avatar_path):
+            os.remove(avatar_path)
+        remove_image_variants(folder='avatars', filename=user.avatar_image)
+
+    user.avatar_image = filename
+    user.save()
+
+    invalidate('user:{}'.format(user.id))
@@ -0,0 +1,148 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from models.revoked_token import RevokedToken
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+# Each worker keeps a Bloom filter of the revoked JTIs in the revoked_token table,
+# refreshed at most every JWT_REVOCATION_SYNC_INTERVAL seconds, so tokens that were
+# never revoked are accepted without a query. Filter hits are confirmed in the table.
+#
+# Rows are synced by created_at rather than id: concurrent revocations can commit out of
+# id order, so each sync re-reads the last JWT_REVOCATION_SYNC_MARGIN seconds as well.
+class RevocationStore:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.recent = OrderedDict()
+        self.last_created_at = None
+        self.last_sync = 0
+        self.last_purge = 0
+
+        self.sync_interval = 1
+        self.sync_margin = 60
+        self.purge_interval = 60 * 60
+        self.capacity = 100000
+        self.lru_size = 1024
+
+    def init_app(self, app):
+        self.sync_interval = app.config.get('JWT_REVOCATION_SYNC_INTERVAL', self.sync_interval)
+        self.sync_margin = app.config.get('JWT_REVOCATION_SYNC_MARGIN', self.sync_margin)
+        self.purge_interval = app.config.get('JWT_REVOCATION_PURGE_INTERVAL', self.purge_interval)
+        self.capacity = app.config.get('JWT_REVOCATION_CAPACITY', self.capacity)
+        self.lru_size = app.config.get('JWT_REVOCATION_LRU_SIZE', self.lru_size)
+
+    def rebuild(self):
+        rows = RevokedToken.get_all_active()
+
+        bloom = BloomFilter(capacity=max(self.capacity, 2 * len(rows)))
+        for row in rows:
+            bloom.add(row.jti)
+
+        self.bloom = bloom
+        self.advance([row.created_at for row in rows])
+
+    def advance(self, created_at):
+        created_at = [value for value in created_at + [self.last_created_at] if value is not None]
+        self.last_created_at = max(created_at) if created_at else None
+
+    def sync(self):
+        now = time.monotonic()
+
+        if self.bloom is not None and now - self.last_sync < self.sync_interval:
+            return
+
+        with self.lock:
+            if self.bloom is None:
+                self.rebuild()
+            else:
+                since = None
+                if self.last_created_at is not None:
+                    since = self.last_created_at - timedelta(seconds=self.sync_margin)
+
+                rows = RevokedToken.get_since(since)
+
+                for row in rows:
+                    # Rows inside the margin are read again on every sync
+                    if row.jti not in self.bloom:
+                        self.bloom.add(row.jti)
+
+                self.advance([row.created_at for row in rows])
+
+                if self.bloom.count > self.bloom.capacity:
+                    self.rebuild()
+
+            self.last_sync = now
+
+    def remember(self, jti):
+        self.recent[jti] = True
+        self.recent.move_to_end(jti)
+
+        while len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+
+    def is_revoked(self, jti):
+        self.sync()
+
+        if jti not in self.bloom:
+            return False
+
+        with self.lock:
+            if jti in self.recent:
+                self.recent.move_to_end(jti)
+                return True
+
+        if RevokedToken.get_by_jti(jti) is None:
+            return False
+
+        with self.lock:
+            self.remember(jti)
+
+        return True
+
+    def revoke(self, jti, expires):
+        token = RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(expires))
+        token.save()
+
+        self.sync()
+
+        with self.lock:
+            self.bloom.add(jti)
+            self.remember(jti)
+
+        if time.monotonic() - self.last_purge > self.purge_interval:
+            self.last_purge = time.monotonic()
+            RevokedToken.delete_expired()
+
+
+revocation_store = RevocationStore()
@@ -0,0 +1,53 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import SelectBase
+
+from pools import InstrumentedQueuePool
+
+# Not accepted by the NullPool/StaticPool that SQLite uses
+QUEUE_POOL_OPTIONS = ['pool_size', 'max_overflow', 'pool_timeout']
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+
+        router = self.app.extensions.get('replica_router')
+
+        # Only plain SELECTs outside a flush may go to a replica; everything else stays on the primary
+        if router is not None and not self._flushing and isinstance(clause, SelectBase) \
+                and getattr(clause, '_for_update_arg', None) is None:
+            engine = router.get_read_engine()
+            if engine is not None:
+                return engine
+
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingEngineConnector(_EngineConnector):
+
+    def get_options(self, sa_url, echo):
+        options = super(RoutingEngineConnector, self).get_options(sa_url, echo)
+
+        # Names the pool in the metrics by its bind; the URL would publish the user, host and database
+        options.setdefault('pool_logging_name', self._bind or 'primary')
+
+        return options
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_connector(self, app=None, bind=None):
+        return RoutingEngineConnector(self, self.get_app(app), bind)
+
+    def create_engine(self, sa_url, engine_opts):
+
+        if sa_url.drivername.startswith('sqlite'):
+            engine_opts = {key: value for key, value in engine_opts.items() if key not in QUEUE_POOL_OPTIONS}
+        else:
+            engine_opts.setdefault('poolclass', InstrumentedQueuePool)
+
+        return super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
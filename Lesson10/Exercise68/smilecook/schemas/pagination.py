@@ -24,8 +24,20 @@ class PaginationSchema(Schema):
 
         return '{}?{}'.format(request.base_url, urlencode(query_args))
 
+    @staticmethod
+    def get_cursor_url(cursor):
+
+        query_args = request.args.to_dict()
+        query_args.pop('page', None)
+        query_args['cursor'] = cursor
+
+        return '{}?{}'.format(request.base_url, urlencode(query_args))
+
     def get_pagination_links(self, paginated_objects):
 
+        if hasattr(paginated_objects, 'next_cursor'):
+            return self.get_cursor_links(paginated_objects)
+
         pagination_links = {
             'first': self.get_url(page=1),
             'last': self.get_url(page=paginated_objects.pages)
@@ -38,3 +50,17 @@ class PaginationSchema(Schema):
             pagination_links['next'] = self.get_url(page=paginated_objects.next_num)
 
         return pagination_links
+
+    def get_cursor_links(self, paginated_objects):
+
+        pagination_links = {
+            'first': self.get_cursor_url(cursor='')
+        }
+
+        if paginated_objects.has_prev:
+            pagination_links['prev'] = self.get_cursor_url(cursor=paginated_objects.prev_cursor)
+
+        if paginated_objects.has_next:
+            pagination_links['next'] = self.get_cursor_url(cursor=paginated_objects.next_cursor)
+
+        return pagination_links
@@ -1,9 +1,10 @@
-from flask import url_for
 from marshmallow import Schema, fields, post_dump, validate, validates, ValidationError
 
 from schemas.user import UserSchema
 from schemas.pagination import PaginationSchema
 
+from utils import get_file_url, get_image_variant_urls
+
 
 def validate_num_of_servings(n):
     if n < 1:
@@ -25,6 +26,7 @@ class RecipeSchema(Schema):
     directions = fields.String(validate=[validate.Length(max=1000)])
     is_publish = fields.Boolean(dump_only=True)
     cover_url = fields.Method(serialize='dump_cover_url')
+    cover_srcset = fields.Method(serialize='dump_cover_srcset')
 
     author = fields.Nested(UserSchema, attribute='user', dump_only=True, exclude=('email', ))
 
@@ -40,9 +42,15 @@ class RecipeSchema(Schema):
 
     def dump_cover_url(self, recipe):
         if recipe.cover_image:
-            return url_for('static', filename='images/recipes/{}'.format(recipe.cover_image), _external=True)
+            return get_file_url('static', filename='images/recipes/{}'.format(recipe.cover_image))
+        else:
+            return get_file_url('static', filename='images/assets/default-recipe-cover.jpg')
+
+    def dump_cover_srcset(self, recipe):
+        if recipe.cover_image:
+            return get_image_variant_urls(folder='recipes', filename=recipe.cover_image)
         else:
-            return url_for('static', filename='images/assets/default-recipe-cover.jpg', _external=True)
+            return get_image_variant_urls(folder='assets', filename='default-recipe-cover.jpg')
 
 
 class RecipePaginationSchema(PaginationSchema):
@@ -1,7 +1,6 @@
-from flask import url_for
 from marshmallow import Schema, fields
 
-from utils import hash_password
+from utils import hash_password, get_file_url, get_image_variant_urls
 
 
 class UserSchema(Schema):
@@ -13,6 +12,7 @@ class UserSchema(Schema):
     email = fields.Email(required=True)
     password = fields.Method(required=True, deserialize='load_password')
     avatar_url = fields.Method(serialize='dump_avatar_url')
+    avatar_srcset = fields.Method(serialize='dump_avatar_srcset')
 
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
@@ -22,9 +22,15 @@ class UserSchema(Schema):
 
     def dump_avatar_url(self, user):
         if user.avatar_image:
-            return url_for('static', filename='images/avatars/{}'.format(user.avatar_image), _external=True)
+            return get_file_url('static', filename='images/avatars/{}'.format(user.avatar_image))
         else:
-            return url_for('static', filename='images/assets/default-avatar.jpg', _external=True)
+            return get_file_url('static', filename='images/assets/default-avatar.jpg')
+
+    def dump_avatar_srcset(self, user):
+        if user.avatar_image:
+            return get_image_variant_urls(folder='avatars', filename=user.avatar_image)
+        else:
+            return get_image_variant_urls(folder='assets', filename='default-avatar.jpg')
 
 
 
@@ -0,0 +1,220 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import case, desc, func, literal_column, or_
+from sqlalchemy.orm import object_session
+
+from extensions import db
+
+TEXT_SEARCH_CONFIG = literal_column("'english'")
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+def document_text(recipe):
+    return ' '.join(filter(None, [recipe.name, recipe.description, recipe.ingredients]))
+
+
+def recipe_document(recipe_cls):
+    # Must match the expression indexed in migrations/versions/a3f1c9d2b7e4_.py
+    return (func.coalesce(recipe_cls.name, literal_column("''")) + literal_column("' '") +
+            func.coalesce(recipe_cls.description, literal_column("''")) + literal_column("' '") +
+            func.coalesce(recipe_cls.ingredients, literal_column("''")))
+
+
+class InvertedIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.vocabulary = []
+        self.loaded = False
+
+    def load(self, rows):
+        with self.lock:
+            for row in rows:
+                self._add(row.id, document_text(row))
+            self.loaded = True
+
+    def add(self, recipe_id, text):
+        with self.lock:
+            self._remove(recipe_id)
+            self._add(recipe_id, text)
+
+    def remove(self, recipe_id):
+        with self.lock:
+            self._remove(recipe_id)
+
+    def _add(self, recipe_id, text):
+        counts = defaultdict(int)
+
+        for token in tokenize(text):
+            counts[token] += 1
+
+        for token, count in counts.items():
+            if token not in self.postings:
+                insort(self.vocabulary, token)
+            self.postings[token][recipe_id] = count
+
+        self.documents[recipe_id] = list(counts)
+
+    def _remove(self, recipe_id):
+        for token in self.documents.pop(recipe_id, []):
+            self.postings[token].pop(recipe_id, None)
+
+    def _expand(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, q):
+        terms = tokenize(q)
+
+        if not terms:
+            return {}
+
+        with self.lock:
+            scores = None
+
+            for term in terms:
+                matches = defaultdict(int)
+                for token in self._expand(term):
+                    for recipe_id, count in self.postings[token].items():
+                        matches[recipe_id] += count
+
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {recipe_id: score + matches[recipe_id]
+                              for recipe_id, score in scores.items() if recipe_id in matches}
+
+                if not scores:
+                    return {}
+
+        return scores
+
+
+def get_backend():
+    backend = current_app.config.get('RECIPE_SEARCH_BACKEND')
+
+    if backend:
+        return backend
+
+    # The inverted index is never picked automatically: it lives in one process and only
+    # sees that process's commits, so other gunicorn workers would serve stale results
+    if db.get_engine().dialect.name == 'postgresql':
+        return 'fulltext'
+
+    return 'like'
+
+
+def get_inverted_index(recipe_cls):
+    index = current_app.extensions.setdefault('recipe_search_index', InvertedIndex())
+
+    if not index.loaded:
+        rows = db.session.query(recipe_cls.id, recipe_cls.name, recipe_cls.description, recipe_cls.ingredients)
+        index.load(rows)
+
+    return index
+
+
+def get_pending_index_changes(target):
+    session = object_session(target)
+    return session.info.setdefault('recipe_search_pending', {}) if session is not None else None
+
+
+def update_inverted_index(mapper, connection, target):
+    # Flushed but not yet committed; applied in apply_inverted_index_changes
+    pending = get_pending_index_changes(target)
+
+    if pending is not None:
+        pending[target.id] = document_text(target)
+
+
+def remove_from_inverted_index(mapper, connection, target):
+    pending = get_pending_index_changes(target)
+
+    if pending is not None:
+        pending[target.id] = None
+
+
+def apply_inverted_index_changes(session):
+    pending = session.info.pop('recipe_search_pending', None)
+    index = current_app.extensions.get('recipe_search_index')
+
+    if not pending or index is None or not index.loaded:
+        return
+
+    for recipe_id, text in pending.items():
+        if text is None:
+            index.remove(recipe_id)
+        else:
+            index.add(recipe_id, text)
+
+
+def discard_inverted_index_changes(session):
+    session.info.pop('recipe_search_pending', None)
+
+
+def refresh_inverted_index(recipe_cls, recipe_ids):
+    # Bulk writes bypass the mapper events above
+    index = current_app.extensions.get('recipe_search_index')
+
+    if index is None or not index.loaded or not recipe_ids:
+        return
+
+    rows = db.session.query(recipe_cls.id, recipe_cls.name, recipe_cls.description, recipe_cls.ingredients).\
+        filter(recipe_cls.id.in_(recipe_ids))
+
+    for row in rows:
+        index.add(row.id, document_text(row))
+
+
+def search_recipes(recipe_cls, query, q, ranked=False):
+    backend = get_backend()
+
+    if backend == 'fulltext':
+        document = recipe_document(recipe_cls)
+        vector = func.to_tsvector(TEXT_SEARCH_CONFIG, document)
+        ts_query = func.plainto_tsquery(TEXT_SEARCH_CONFIG, q)
+
+        # The trigram match keeps the old substring semantics for partial words
+        query = query.filter(or_(vector.op('@@')(ts_query),
+                                 document.ilike('%{}%'.format(q))))
+
+        if ranked:
+            query = query.order_by(desc(func.ts_rank(vector, ts_query)))
+
+    elif backend == 'inverted_index':
+        scores = get_inverted_index(recipe_cls).search(q)
+
+        # The ids go to the database as an IN list (and a CASE for ranking), so only the best matches are sent
+        max_candidates = current_app.config.get('RECIPE_SEARCH_MAX_CANDIDATES')
+        if max_candidates and len(scores) > max_candidates:
+            scores = dict(heapq.nlargest(max_candidates, scores.items(), key=lambda item: (item[1], item[0])))
+
+        query = query.filter(recipe_cls.id.in_(list(scores)))
+
+        if ranked and scores:
+            query = query.order_by(desc(case(scores, value=recipe_cls.id, else_=0)))
+
+    else:
+        keyword = '%{keyword}%'.format(keyword=q)
+
+        query = query.filter(or_(recipe_cls.name.ilike(keyword),
+                                 recipe_cls.description.ilike(keyword),
+                                 recipe_cls.ingredients.ilike(keyword)))
+
+    return query
@@ -0,0 +1,85 @@
+from flask import current_app
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import isoformat
+
+compiled_schemas = {}
+
+
+def compile_value(convert):
+
+    def get(obj, attribute):
+        value = getattr(obj, attribute, missing)
+
+        if value is missing or value is None:
+            return value
+
+        return convert(value)
+
+    return get
+
+
+def compile_field(schema, field):
+
+    if type(field) is fields.Method:
+        method = getattr(schema, field.serialize_method_name)
+        return lambda obj, attribute: method(obj)
+
+    if type(field) is fields.Nested:
+        dump_nested = compile_schema(field.schema)
+        return compile_value(dump_nested)
+
+    if type(field) is fields.Integer:
+        return compile_value(int)
+
+    if type(field) is fields.String:
+        return compile_value(str)
+
+    if type(field) is fields.Boolean:
+        return compile_value(bool)
+
+    if type(field) is fields.DateTime and field.dateformat in (None, 'iso'):
+        return compile_value(isoformat)
+
+    # Anything else goes through marshmallow itself
+    return lambda obj, attribute: field.serialize(attribute, obj, accessor=schema.get_attribute)
+
+
+def compile_schema(schema):
+
+    if schema in compiled_schemas:
+        return compiled_schemas[schema]
+
+    has_dump_processors = any(tag in (PRE_DUMP, POST_DUMP) for tag, _ in schema.__processors__)
+
+    if has_dump_processors or schema.prefix:
+        dump_one = lambda obj: schema.dump(obj, many=False).data
+    else:
+        getters = [(field.dump_to or name, field.attribute or name, compile_field(schema, field))
+                   for name, field in schema.fields.items()
+                   if not field.load_only and not (type(field) is fields.Method and not field.serialize_method_name)]
+
+        def dump_one(obj):
+            data = {}
+
+            for key, attribute, get in getters:
+                value = get(obj, attribute)
+                if value is not missing:
+                    data[key] = value
+
+            return data
+
+    if schema.many:
+        compiled_schemas[schema] = lambda objs: [dump_one(obj) for obj in objs]
+    else:
+        compiled_schemas[schema] = dump_one
+
+    return compiled_schemas[schema]
+
+
+def dump(schema, obj):
+
+    if current_app.config.get('COMPILED_SERIALIZERS'):
+        return compile_schema(schema)(obj)
+
+    return schema.dump(obj).data
@@ -0,0 +1,147 @@
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import request, send_file
+from flask.helpers import safe_join
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Uploads and their variants are named <uuid4>.jpg / <uuid4>-<variant>.<format>
+UUID_FILENAME = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[-.]')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Preferred first
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def is_immutable(path):
+    return UUID_FILENAME.match(os.path.basename(path)) is not None
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def get_precompressed(path):
+
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if not request.accept_encodings[encoding]:
+            continue
+
+        try:
+            if os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                return path + suffix, encoding
+        except OSError:
+            continue
+
+    return path, None
+
+
+def compress_file(path, encoding):
+
+    suffix = dict(PRECOMPRESSED_ENCODINGS)[encoding]
+    temp_path = '{}{}.tmp'.format(path, suffix)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=11)
+    else:
+        data = gzip.compress(data, compresslevel=9)
+
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+
+    shutil.copystat(path, temp_path)
+    os.replace(temp_path, path + suffix)
+
+    return len(data)
+
+
+class StaticFiles:
+
+    def __init__(self):
+        self.delivery = 'app'
+        self.x_accel_prefix = '/'
+        self.root_path = None
+        self.immutable_max_age = None
+
+    def init_app(self, app):
+        self.delivery = app.config.get('STATIC_DELIVERY', 'app')
+        self.x_accel_prefix = app.config.get('STATIC_X_ACCEL_PREFIX', '/')
+        self.root_path = app.root_path
+        self.immutable_max_age = app.config.get('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 60 * 60)
+
+        # send_file leaves the body to the front proxy and only sets the headers
+        app.config['USE_X_SENDFILE'] = self.delivery in ('x-sendfile', 'x-accel-redirect')
+
+        def static(filename):
+            return self.send(safe_join(app.static_folder, filename))
+
+        app.view_functions['static'] = static
+
+        @app.cli.command('compress-static')
+        def compress_static():
+            """Write .gz and .br copies of the text assets under the static folder."""
+
+            encodings = ['gzip'] if brotli is None else ['br', 'gzip']
+
+            for directory, _, filenames in os.walk(app.static_folder):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    mimetype = mimetypes.guess_type(path)[0]
+
+                    if mimetype is None or not is_compressible(mimetype) or path.endswith(('.gz', '.br', '.tmp')):
+                        continue
+
+                    sizes = ['{} {}'.format(encoding, compress_file(path, encoding)) for encoding in encodings]
+                    click.echo('{}: {} -> {}'.format(path, os.path.getsize(path), ', '.join(sizes)))
+
+    def send(self, path, mimetype=None):
+
+        if not os.path.isfile(path):
+            raise NotFound()
+
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        encoding = None
+
+        # nginx drops Content-Encoding on an internal redirect; use its gzip_static/brotli_static there
+        if is_compressible(mimetype) and self.delivery != 'x-accel-redirect':
+            path, encoding = get_precompressed(path)
+
+        immutable = is_immutable(path)
+
+        # Conditional: ETag/Last-Modified validation and Range requests; with the default
+        # delivery the body goes through wsgi.file_wrapper, which gunicorn sends with sendfile()
+        response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True,
+                             cache_timeout=self.immutable_max_age if immutable else None)
+
+        if immutable:
+            response.headers['Cache-Control'] += ', immutable'
+
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+
+        if is_compressible(mimetype):
+            response.vary.add('Accept-Encoding')
+
+        if 'X-Sendfile' in response.headers and self.delivery == 'x-accel-redirect':
+            # nginx: location <prefix> { internal; alias <app root>/; }
+            relative_path = os.path.relpath(response.headers.pop('X-Sendfile'), self.root_path)
+            response.headers['X-Accel-Redirect'] = self.x_accel_prefix + relative_path.replace(os.sep, '/')
+
+        return response
+
+
+static_files = StaticFiles()
@@ -1,23 +1,28 @@
 import os
+import re
 import uuid
 
 from PIL import Image
-from flask_uploads import extension
 
-from passlib.hash import pbkdf2_sha256
 from itsdangerous import URLSafeTimedSerializer
 
-from flask import current_app
+from flask import current_app, g, url_for
+from werkzeug.urls import url_quote
 
-from extensions import image_set, cache
+from extensions import image_set
+from passwords import password_hasher
+
+IMAGE_FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+
+URL_SAFE_FILENAME = re.compile(r'[A-Za-z0-9_.~/:-]*')
 
 
 def hash_password(password):
-    return pbkdf2_sha256.hash(password)
+    return password_hasher.hash(password)
 
 
 def check_password(password, hashed):
-    return pbkdf2_sha256.verify(password, hashed)
+    return password_hasher.verify(password, hashed)
 
 
 def generate_token(email, salt=None):
@@ -35,19 +40,7 @@ def verify_token(token, max_age=(30 * 60), salt=None):
     return email
 
 
-def save_image(image, folder):
-
-    filename = '{}.{}'.format(uuid.uuid4(), extension(image.filename))
-    image_set.save(image, folder=folder, name=filename)
-
-    filename = compress_image(filename=filename, folder=folder)
-
-    return filename
-
-
-def compress_image(filename, folder):
-
-    file_path = image_set.path(filename=filename, folder=folder)
+def compress_image_file(file_path, compressed_file_path):
 
     image = Image.open(file_path)
 
@@ -58,9 +51,6 @@ def compress_image(filename, folder):
         maxsize = (1600, 1600)
         image.thumbnail(maxsize)
 
-    compressed_filename = '{}.jpg'.format(uuid.uuid4())
-    compressed_file_path = image_set.path(filename=compressed_filename, folder=folder)
-
     image.save(compressed_file_path, optimize=True, quality=85)
 
     original_size = os.stat(file_path).st_size
@@ -71,11 +61,72 @@ def compress_image(filename, folder):
 
     os.remove(file_path)
 
-    return compressed_filename
+
+def get_image_variant_path(folder, filename, variant, image_format):
+
+    name = '{}-{}.{}'.format(os.path.splitext(filename)[0], variant, image_format)
+
+    return image_set.path(filename=name, folder='variants/{}'.format(folder))
+
+
+def generate_image_variant(source_path, variant_path, size, image_format):
+
+    image = Image.open(source_path)
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail((size, size))
+
+    os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+
+    temp_path = '{}.{}.tmp'.format(variant_path, uuid.uuid4())
+
+    image.save(temp_path, format=IMAGE_FORMATS[image_format], optimize=True, quality=85)
+
+    os.replace(temp_path, variant_path)
+
+
+def remove_image_variants(folder, filename):
+
+    for variant in current_app.config['IMAGE_VARIANTS']:
+        for image_format in IMAGE_FORMATS:
+            variant_path = get_image_variant_path(folder, filename, variant, image_format)
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+
+
+def get_url_prefix(endpoint, **values):
+
+    # Building a URL per image dominated list serialisation; only the filename differs between rows
+    prefixes = g.setdefault('url_prefixes', {})
+    key = (endpoint, ) + tuple(sorted(values.items()))
+
+    if key not in prefixes:
+        prefixes[key] = url_for(endpoint, filename='', _external=True, **values)
+
+    return prefixes[key]
+
+
+def quote_filename(filename):
+
+    # Quoted the same way as werkzeug's string/path converters; uploaded names never need it
+    if URL_SAFE_FILENAME.fullmatch(filename):
+        return filename
+
+    return url_quote(filename, safe='/:')
+
+
+def get_file_url(endpoint, filename, **values):
+    return get_url_prefix(endpoint, **values) + quote_filename(filename)
 
 
-def clear_cache(key_prefix):
+def get_image_variant_urls(folder, filename):
 
-    keys = [key for key in cache.cache._cache.keys() if key.startswith(key_prefix)]
+    stem = quote_filename(os.path.splitext(filename)[0])
+    prefixes = {variant: get_url_prefix('imagevariantresource', folder=folder, variant=variant)
+                for variant in current_app.config['IMAGE_VARIANTS']}
 
-    cache.delete_many(*keys)
+    return {image_format: {variant: '{}{}.{}'.format(prefix, stem, image_format)
+                           for variant, prefix in prefixes.items()}
+            for image_format in IMAGE_FORMATS}